@@ -0,0 +1,70 @@
+"""
+/api/analytics/skills の計算とシリアライズの所要時間を合成データで計測する。
+
+    python -m benchmarks.analytics_skills [--users 10000] [--days 365] [--results-per-user 20] [--legacy]
+
+--legacy を付けると、以前の返し方(.tolist() を jsonable_encoder に通す)も計測する(数十秒かかる)。
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from routers.analytics_router import ENCODINGS, compute_skill_trajectories, serialize_trajectories
+from utils.skills import SKILL_KEYS
+
+Row = namedtuple("Row", "user_id category correct_answers created_at")
+
+
+def make_data(n_users: int, n_days: int, results_per_user: int, start: datetime):
+    rng = random.Random(0)
+    user_ids = [f"user{i:06d}" for i in range(n_users)]
+    base = {user_id: {key: rng.randint(0, 50) for key in SKILL_KEYS} for user_id in user_ids}
+    categories = ["Biz", "Design", "Tech"]
+    results = [
+        Row(user_id, rng.choice(categories), rng.randint(0, 5), start + timedelta(seconds=rng.randrange(n_days * 86400)))
+        for user_id in user_ids
+        for _ in range(results_per_user)
+    ]
+    return user_ids, base, results
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    value = func()
+    print(f"{label:<32} {(time.perf_counter() - started) * 1000:10.1f} ms")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.analytics_skills")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--results-per-user", type=int, default=20)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 1)
+    user_ids, base, results = make_data(args.users, args.days, args.results_per_user, start)
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(args.days)]
+    print(f"{args.users} users x {args.days} days, {len(results)} test results")
+
+    trajectories = timed("compute_skill_trajectories", lambda: compute_skill_trajectories(
+        user_ids, base, results, start, args.days
+    ))
+    for encoding in ENCODINGS:
+        body = timed(f"serialize (encoding={encoding})", lambda: serialize_trajectories(
+            dates, user_ids, trajectories, encoding
+        ))
+        print(f"{'':<32} {len(body) / 1e6:10.1f} MB")
+
+    if args.legacy:
+        from fastapi.encoders import jsonable_encoder
+        timed("legacy tolist + jsonable_encoder", lambda: jsonable_encoder(
+            {key: trajectories[key].tolist() for key in SKILL_KEYS}
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+ログイン直後の読み込みを、従来の4回呼び出し(/api/user/me → /api/user/skills →
+/api/user/orientation → /api/team/{team_id})と /api/user/bootstrap の1回で比較する。
+合成データを入れたSQLite(メモリ上)に対してアプリを直接呼び出して計測する。
+
+    python -m benchmarks.bootstrap [--users 1000] [--team-size 5] [--requests 200] [--warm]
+
+既定では1回ごとにキャッシュを空にする(--warm を付けるとキャッシュ済みの状態で計測する)。
+ネットワークの往復時間は含まないため、実環境では呼び出し回数の差がさらに効く。
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import db.database
+from db.database import Base, get_db, get_read_db
+from db.models import UserMaster, StatusTable, Specialty, Orientation, Team, TeamMember, TestResult, Quiz
+from utils.cache import cache
+from utils.security import create_access_token
+
+
+def make_session_factory(n_users: int, team_size: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    db = Session()
+    for specialty in ("Biz", "Design", "Tech"):
+        db.add(Specialty(specialty=specialty))
+    orientations = [Orientation(orientation=name) for name in ("leader", "maker", "planner")]
+    db.add_all(orientations)
+    for i in range(n_users):
+        user_id = f"user{i:06d}"
+        user = UserMaster(user_id=user_id, name=f"User {i}", password="x", core_time="平日 19:00-22:00")
+        user.orientations = rng.sample(orientations, 2)
+        db.add(user)
+        db.add(StatusTable(user_id=user_id, biz=rng.randint(0, 50), design=rng.randint(0, 50), tech=rng.randint(0, 50)))
+        for _ in range(20):
+            db.add(TestResult(
+                user_id=user_id,
+                category=rng.choice(["Biz", "Design", "Tech"]),
+                correct_answers=rng.randint(0, 5),
+                created_at=start + timedelta(seconds=rng.randrange(365 * 86400)),
+            ))
+    # 役割はチーム内で重複できない
+    for team_id in range(1, n_users // team_size + 1):
+        db.add(Team(id=team_id, name=f"Team {team_id}"))
+        for j in range(team_size):
+            user_id = f"user{(team_id - 1) * team_size + j:06d}"
+            db.add(TeamMember(team_id=team_id, role=f"Role {j}", user_id=user_id))
+    for day in range(60):
+        db.add(Quiz(date=(start + timedelta(days=day)).date(), category="Tech", question_text="q", options="a,b",
+                    correct_index=0, explanation=""))
+    db.commit()
+    db.close()
+    return Session
+
+
+def waterfall(client, headers):
+    me = client.get("/api/user/me", headers=headers)
+    me.raise_for_status()
+    client.get("/api/user/skills", headers=headers).raise_for_status()
+    client.get("/api/user/orientation", headers=headers).raise_for_status()
+    client.get(f"/api/team/{me.json()['team_id']}", headers=headers).raise_for_status()
+
+
+def bootstrap(client, headers):
+    client.get("/api/user/bootstrap", headers=headers).raise_for_status()
+
+
+def measure(label: str, func, client, user_ids, warm: bool):
+    durations = []
+    for user_id in user_ids:
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+        if warm:
+            func(client, headers)
+        else:
+            cache.backend._data.clear()
+        started = time.perf_counter()
+        func(client, headers)
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{label:<24} median {statistics.median(durations):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bootstrap")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warm", action="store_true")
+    args = parser.parse_args()
+
+    Session = make_session_factory(args.users, args.team_size)
+
+    def override():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # キャッシュの読み込みなどプライマリを直接開く処理も同じDBを使う
+    db.database.SessionLocal = Session
+
+    import main as app_main
+    from fastapi.testclient import TestClient
+    app_main.app.dependency_overrides[get_db] = override
+    app_main.app.dependency_overrides[get_read_db] = override
+    client = TestClient(app_main.app)
+
+    rng = random.Random(1)
+    members = args.users // args.team_size * args.team_size
+    user_ids = [f"user{rng.randrange(members):06d}" for _ in range(args.requests)]
+    print(f"{args.users} users, {args.requests} requests, cache {'warm' if args.warm else 'cold'}")
+    # bootstrap は従来の4回分に加えて最新のクイズ日付も返す
+    measure("waterfall (4 calls)", waterfall, client, user_ids, args.warm)
+    measure("bootstrap (1 call)", bootstrap, client, user_ids, args.warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+ETagによる再検証で、200(本文あり)と304(If-None-Match一致)の所要時間と転送量を比較する。
+合成データを入れたSQLite(メモリ上)に対してアプリを直接呼び出して計測する。
+
+    python -m benchmarks.http_cache [--users 1000] [--team-size 5] [--requests 200] [--cold]
+
+304でもハンドラーは最後まで実行されるため、差が出るのは本文の圧縮と転送の分だけ。
+既定ではキャッシュ済みの状態で計測する(--cold を付けると1回ごとにキャッシュを空にする)。
+"""
+import argparse
+import random
+import statistics
+import time
+
+import db.database
+from db.database import get_db, get_read_db
+from utils.cache import cache
+from utils.security import create_access_token
+from benchmarks.bootstrap import make_session_factory
+
+PATHS = ["/api/user/bootstrap", "/api/user/skills", "/api/team/{team_id}"]
+
+
+def measure(label: str, client, requests, cold: bool, revalidate: bool):
+    durations, sent = [], 0
+    for path, headers, etag in requests:
+        if cold:
+            cache.backend._data.clear()
+        request_headers = dict(headers, **{"If-None-Match": etag}) if revalidate else headers
+        started = time.perf_counter()
+        response = client.get(path, headers=request_headers)
+        durations.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == (304 if revalidate else 200), response.status_code
+        sent += int(response.headers.get("content-length", 0))
+    durations.sort()
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(
+        f"{label:<34} median {statistics.median(durations):8.2f} ms   p95 {p95:8.2f} ms"
+        f"   body {sent / len(requests):9.0f} B/req"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.http_cache")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--cold", action="store_true")
+    args = parser.parse_args()
+
+    Session = make_session_factory(args.users, args.team_size)
+
+    def override():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # キャッシュの読み込みなどプライマリを直接開く処理も同じDBを使う
+    db.database.SessionLocal = Session
+
+    import main as app_main
+    from fastapi.testclient import TestClient
+    app_main.app.dependency_overrides[get_db] = override
+    app_main.app.dependency_overrides[get_read_db] = override
+    client = TestClient(app_main.app)
+
+    rng = random.Random(1)
+    members = args.users // args.team_size * args.team_size
+    print(f"{args.users} users, {args.requests} requests per path, cache {'cold' if args.cold else 'warm'}")
+    for template in PATHS:
+        requests = []
+        for _ in range(args.requests):
+            index = rng.randrange(members)
+            headers = {
+                "Authorization": f"Bearer {create_access_token({'sub': f'user{index:06d}'})}",
+                "Accept-Encoding": "gzip",
+            }
+            path = template.format(team_id=index // args.team_size + 1)
+            # 1回目の応答のETagを、再検証のリクエストに付ける
+            etag = client.get(path, headers=headers).headers["etag"]
+            requests.append((path, headers, etag))
+        measure(f"{template} 200", client, requests, args.cold, revalidate=False)
+        measure(f"{template} 304", client, requests, args.cold, revalidate=True)
+
+
+if __name__ == "__main__":
+    main()
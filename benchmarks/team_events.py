@@ -0,0 +1,102 @@
+"""
+TeamEventBroker の配信遅延を計測する。M 件の購読者(チームごと + 全チーム購読)に対して
+N 件のイベントを publish し、publish から購読者が受け取るまでの時間を集計する。
+
+    python -m benchmarks.team_events [--events 1000] [--subscribers 1000] [--teams 100] [--all-teams 10]
+                                      [--rate 0] [--from-thread]
+
+--rate は1秒あたりの publish 数(0 は待たずに連続で publish する)。
+--from-thread を付けると、同期ハンドラと同じくイベントループ外のスレッドから publish する。
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from utils.team_events import TeamEventBroker, ALL_TEAMS
+
+# この時間受信がなければ配信が終わったとみなす
+QUIET_SECONDS = 0.5
+
+
+def percentile(values, p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def consume(subscription, latencies: list, resyncs: list, last: list):
+    while True:
+        event = await subscription.get()
+        last[0] = received_at = time.perf_counter()
+        if event["type"] == "resync":
+            resyncs.append(1)
+            continue
+        latencies.append((received_at - event["sent"]) * 1000)
+
+
+async def run(args):
+    broker = TeamEventBroker(
+        max_subscribers=args.subscribers + args.all_teams,
+        max_per_team=args.subscribers,
+    )
+    subscriptions = [broker.subscribe(i % args.teams) for i in range(args.subscribers)]
+    subscriptions += [broker.subscribe(ALL_TEAMS) for _ in range(args.all_teams)]
+    latencies, resyncs, last = [], [], [0.0]
+    consumers = [asyncio.create_task(consume(s, latencies, resyncs, last)) for s in subscriptions]
+
+    # チームごとの購読者に加えて、全チーム購読者にも届く
+    per_team = [sum(1 for i in range(args.subscribers) if i % args.teams == team) for team in range(args.teams)]
+    expected = sum(per_team[i % args.teams] + args.all_teams for i in range(args.events))
+    interval = 1 / args.rate if args.rate else 0
+
+    def publish_all():
+        for i in range(args.events):
+            broker.publish("member_added", i % args.teams, role="Tech", user_id=f"user{i}", sent=time.perf_counter())
+            if interval:
+                time.sleep(interval)
+
+    started = time.perf_counter()
+    if args.from_thread:
+        thread = threading.Thread(target=publish_all)
+        thread.start()
+        while thread.is_alive():
+            await asyncio.sleep(0.001)
+    else:
+        for i in range(args.events):
+            broker.publish("member_added", i % args.teams, role="Tech", user_id=f"user{i}", sent=time.perf_counter())
+            await asyncio.sleep(interval)
+    published = time.perf_counter() - started
+
+    # キューがあふれた購読者は未送信分を破棄する(resync)ため、受信が止まったら打ち切る
+    while len(latencies) < expected and time.perf_counter() - max(last[0], started + published) < QUIET_SECONDS:
+        await asyncio.sleep(0.01)
+    elapsed = max(last[0], started + published) - started
+    for consumer in consumers:
+        consumer.cancel()
+
+    latencies.sort()
+    print(f"{args.events} events -> {len(subscriptions)} subscribers ({args.teams} teams, {args.all_teams} all-teams)")
+    print(f"publish: {published * 1000:.1f} ms ({args.events / published:,.0f} events/s)")
+    print(f"delivered: {len(latencies)}/{expected} in {elapsed * 1000:.1f} ms ({len(latencies) / elapsed:,.0f} deliveries/s)")
+    print(f"dropped: {expected - len(latencies)} (resync sent {len(resyncs)} times)")
+    if latencies:
+        print(
+            f"latency ms: p50 {statistics.median(latencies):.2f}  p95 {percentile(latencies, 0.95):.2f}  "
+            f"p99 {percentile(latencies, 0.99):.2f}  max {latencies[-1]:.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.team_events")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--all-teams", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=0)
+    parser.add_argument("--from-thread", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,67 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-SERVER_URL = os.environ["SERVER_URL"]
-DATABASE = os.environ["DATABASE"]
-USER_NAME = os.environ["USER_NAME"]
-PASSWORD = os.environ["PASSWORD"]
-SERVER_PORT = os.environ["SERVER_PORT"]
-SSL_CA_PATH = os.environ.get("SSL_CA_PATH", "")
+# DATABASE_URLが指定されていればそれを使う(ローカル検証でSQLiteを使う場合など)
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
 
-DATABASE_URL = f"mysql+pymysql://{USER_NAME}:{PASSWORD}@{SERVER_URL}:{SERVER_PORT}/{DATABASE}?charset=utf8"
+if not DATABASE_URL:
+    SERVER_URL = os.environ["SERVER_URL"]
+    DATABASE = os.environ["DATABASE"]
+    USER_NAME = os.environ["USER_NAME"]
+    PASSWORD = os.environ["PASSWORD"]
+    SERVER_PORT = os.environ["SERVER_PORT"]
+    SSL_CA_PATH = os.environ.get("SSL_CA_PATH", "")
 
-# SSLを使用する場合
-if SSL_CA_PATH:
-    DATABASE_URL += f"&ssl_ca={SSL_CA_PATH}"
+    DATABASE_URL = f"mysql+pymysql://{USER_NAME}:{PASSWORD}@{SERVER_URL}:{SERVER_PORT}/{DATABASE}?charset=utf8"
+
+    # SSLを使用する場合
+    if SSL_CA_PATH:
+        DATABASE_URL += f"&ssl_ca={SSL_CA_PATH}"
+
+# 読み取り専用リクエストを振り分けるリードレプリカ(カンマ区切りで複数指定可)
+READ_REPLICA_URLS = [url for url in os.environ.get("READ_REPLICA_URLS", "").split(",") if url]
+# 接続に失敗したレプリカを振り分け対象から外す時間(秒)
+REPLICA_RETRY_SECONDS = int(os.environ.get("REPLICA_RETRY_SECONDS", "30"))
+# 書き込み後、同じクライアントの読み取りをプライマリに送る時間(秒)
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
 
 # セキュリティ設定
 SECRET_KEY = os.environ.get("NEXTAUTH_SECRET", "fallback_secret_key")  # 環境変数がない場合はデフォルト値
 ALGORITHM = "HS256"  # JWTの署名アルゴリズム
 
 # CORS設定（必要に応じて追加）
-ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*").split(",")  # 環境変数からカンマ区切りで取得
\ No newline at end of file
+ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*").split(",")  # 環境変数からカンマ区切りで取得
+
+# リーダーボード設定(秒)。他ワーカーでの更新を取り込むため、この間隔で再構築する
+LEADERBOARD_MAX_AGE = int(os.environ.get("LEADERBOARD_MAX_AGE", "600"))
+
+# チーム更新イベント配信の設定(同時接続数の上限と、接続ごとの未送信イベント数の上限)
+TEAM_EVENTS_MAX_SUBSCRIBERS = int(os.environ.get("TEAM_EVENTS_MAX_SUBSCRIBERS", "2000"))
+TEAM_EVENTS_MAX_SUBSCRIBERS_PER_TEAM = int(os.environ.get("TEAM_EVENTS_MAX_SUBSCRIBERS_PER_TEAM", "100"))
+TEAM_EVENTS_QUEUE_SIZE = int(os.environ.get("TEAM_EVENTS_QUEUE_SIZE", "100"))
+
+# レート制限(ユーザー単位のトークンバケット。ログインはIPと入力されたユーザーIDの組単位)
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("RATE_LIMIT_PER_MINUTE", "120"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "30"))
+LOGIN_RATE_LIMIT_PER_MINUTE = int(os.environ.get("LOGIN_RATE_LIMIT_PER_MINUTE", "10"))
+LOGIN_RATE_LIMIT_BURST = int(os.environ.get("LOGIN_RATE_LIMIT_BURST", "5"))
+# X-Forwarded-For を信頼するプロキシのIP(カンマ区切り)。空ならリクエスト元のIPをそのまま使う
+TRUSTED_PROXIES = [ip.strip() for ip in os.environ.get("TRUSTED_PROXIES", "").split(",") if ip.strip()]
+# 重いエンドポイントの同時実行数の上限(エンドポイントごと)
+EXPENSIVE_ROUTE_CONCURRENCY = int(os.environ.get("EXPENSIVE_ROUTE_CONCURRENCY", "8"))
+
+# この大きさ(バイト)以上のレスポンスを圧縮する
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# キャッシュ設定。複数ワーカーで共有・無効化する場合は CACHE_BACKEND=redis にする
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+CACHE_DEFAULT_TTL = int(os.environ.get("CACHE_DEFAULT_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+
+# 派生データ(スキルのスナップショット)の再計算設定
+PRECOMPUTE_REFRESH_SECONDS = int(os.environ.get("PRECOMPUTE_REFRESH_SECONDS", "300"))  # 全件を再計算する間隔
+PRECOMPUTE_MAX_STALENESS = int(os.environ.get("PRECOMPUTE_MAX_STALENESS", "600"))  # これより古いスナップショットは使わない
+PRECOMPUTE_DEBOUNCE_SECONDS = float(os.environ.get("PRECOMPUTE_DEBOUNCE_SECONDS", "1.0"))  # 書き込みをまとめて再計算する待ち時間
+PRECOMPUTE_BATCH_SIZE = int(os.environ.get("PRECOMPUTE_BATCH_SIZE", "500"))
+PRECOMPUTE_MAX_RETRIES = int(os.environ.get("PRECOMPUTE_MAX_RETRIES", "3"))  # デッドロック・ロック待ちタイムアウト時の再試行回数
@@ -1,20 +1,164 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from fastapi import Request, Response
+import itertools
+import logging
+import threading
+import time
 
-from db.config import DATABASE_URL
+from db.config import DATABASE_URL, READ_REPLICA_URLS, REPLICA_RETRY_SECONDS, READ_YOUR_WRITES_SECONDS
 
-engine = create_engine(
-    DATABASE_URL, echo=False, pool_pre_ping=True
-)
+logger = logging.getLogger(__name__)
+
+
+def _create_engine(url: str):
+    # SQLiteはスレッドプールから使うため同一スレッド制約を外す
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, echo=False, pool_pre_ping=True, connect_args=connect_args)
+
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in READ_REPLICA_URLS]
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
-def get_db():
+
+class ReplicaRouter:
+    """リードレプリカをラウンドロビンで選び、接続に失敗したものは一定時間外す"""
+
+    def __init__(self, engines, retry_seconds: int = REPLICA_RETRY_SECONDS):
+        self.engines = list(engines)
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(range(len(self.engines)))
+        self._down_until = {}
+        self._served = [0] * len(self.engines)
+        self._failures = [0] * len(self.engines)
+
+    def candidates(self) -> list:
+        """今回試す順序でレプリカのインデックスを返す(外されているものは除く)"""
+        if not self.engines:
+            return []
+        with self._lock:
+            start = next(self._cycle)
+            now = time.monotonic()
+            order = [(start + i) % len(self.engines) for i in range(len(self.engines))]
+            return [i for i in order if self._down_until.get(i, 0) <= now]
+
+    def mark_down(self, index: int):
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_seconds
+            self._failures[index] += 1
+        logger.warning(f"Read replica {index} is unavailable; retrying in {self.retry_seconds}s")
+
+    def mark_served(self, index: int):
+        with self._lock:
+            self._down_until.pop(index, None)
+            self._served[index] += 1
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "replica": i,
+                    "url": e.url.render_as_string(hide_password=True),
+                    "healthy": self._down_until.get(i, 0) <= now,
+                    "served": self._served[i],
+                    "failures": self._failures[i],
+                }
+                for i, e in enumerate(self.engines)
+            ]
+
+
+replica_router = ReplicaRouter(replica_engines)
+
+# read-your-writes用に、プライマリから読む期限(UNIX時刻)をクライアントに持たせる。
+# ワーカーごとのメモリに持つと、書き込みを受けたワーカー以外では判定できないため。
+# ブラウザはCookieを自動で送り、それ以外のクライアントはヘッダーの値をそのまま送り返す
+PRIMARY_UNTIL_COOKIE = "primary_until"
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_write(session):
+    response = session.info.get("response")
+    if response is None or session.info.get("primary_until"):
+        return
+    until = f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}"
+    session.info["primary_until"] = until
+    response.headers[PRIMARY_UNTIL_HEADER] = until
+    response.set_cookie(
+        PRIMARY_UNTIL_COOKIE, until, max_age=READ_YOUR_WRITES_SECONDS,
+        httponly=True, secure=True, samesite="none",
+    )
+
+
+def _wrote_recently(request: Request) -> bool:
+    value = request.cookies.get(PRIMARY_UNTIL_COOKIE) or request.headers.get(PRIMARY_UNTIL_HEADER)
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+
+def get_db(response: Response):
+    db = SessionLocal()
+    # コミット時にプライマリから読む期限をレスポンスに付ける
+    db.info["response"] = response
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def open_read_session():
+    """健全なレプリカのセッションを返す。使えるレプリカがなければプライマリを使う"""
+    for index in replica_router.candidates():
+        db = ReadSessionLocal(bind=replica_engines[index])
+        try:
+            # 接続確認(pool_pre_pingにより切断済みの接続はここで検出される)
+            db.connection()
+        except DBAPIError:
+            db.close()
+            replica_router.mark_down(index)
+            continue
+        replica_router.mark_served(index)
+        return db
+    return SessionLocal()
+
+
+def run_on_primary(loader, *args):
+    """
+    プライマリのセッションで loader(db, *args) を実行する。
+    全クライアントで共有するキャッシュに載せる値は、遅延のあるレプリカから読まない。
+    """
     db = SessionLocal()
+    try:
+        return loader(db, *args)
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """
+    読み取り専用ハンドラ用のセッション。
+    直前に書き込んだクライアントや X-Consistency: strong を指定したリクエストはプライマリに送る。
+    """
+    if (
+        not replica_engines
+        or request.headers.get("x-consistency") == "strong"
+        or _wrote_recently(request)
+    ):
+        db = SessionLocal()
+    else:
+        db = open_read_session()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
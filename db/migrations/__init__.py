@@ -0,0 +1,99 @@
+"""
+バージョン管理されたスキーマ変更。
+
+各マイグレーションは db/migrations/mXXXX_*.py に VERSION / DESCRIPTION /
+upgrade(conn) / downgrade(conn) を定義し、MIGRATIONS に登録する。
+適用済みのバージョンは schema_migrations テーブルに記録される。
+
+    python -m db.migrations status
+    python -m db.migrations upgrade [--target N]
+    python -m db.migrations downgrade --target N
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+
+from db.migrations import (
+    m0001_hot_path_indexes,
+    m0002_core_time_bitmap,
+    m0003_skill_snapshots,
+    m0004_job_leases,
+    m0005_rebackfill_core_time_bitmap,
+    m0006_snapshot_invalidated_at,
+)
+
+MIGRATIONS = sorted(
+    [
+        m0001_hot_path_indexes,
+        m0002_core_time_bitmap,
+        m0003_skill_snapshots,
+        m0004_job_leases,
+        m0005_rebackfill_core_time_bitmap,
+        m0006_snapshot_invalidated_at,
+    ],
+    key=lambda m: m.VERSION,
+)
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def head() -> int:
+    return MIGRATIONS[-1].VERSION if MIGRATIONS else 0
+
+
+def applied_versions(conn) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade(engine, target: int = None) -> list:
+    """未適用のマイグレーションを target まで順に適用し、適用したバージョンを返す"""
+    target = head() if target is None else target
+    applied = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for migration in MIGRATIONS:
+        if migration.VERSION > target or migration.VERSION in done:
+            continue
+        # マイグレーションごとにトランザクションを分ける
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration.VERSION,
+                description=migration.DESCRIPTION,
+                applied_at=datetime.utcnow(),
+            ))
+        applied.append(migration.VERSION)
+    return applied
+
+
+def downgrade(engine, target: int) -> list:
+    """target より新しい適用済みマイグレーションを新しい順に戻し、戻したバージョンを返す"""
+    reverted = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for migration in reversed(MIGRATIONS):
+        if migration.VERSION <= target or migration.VERSION not in done:
+            continue
+        with engine.begin() as conn:
+            migration.downgrade(conn)
+            conn.execute(schema_migrations.delete().where(schema_migrations.c.version == migration.VERSION))
+        reverted.append(migration.VERSION)
+    return reverted
+
+
+def status(engine) -> list:
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    return [
+        {"version": m.VERSION, "description": m.DESCRIPTION, "applied": m.VERSION in done}
+        for m in MIGRATIONS
+    ]
@@ -0,0 +1,28 @@
+import argparse
+
+from db.database import engine
+from db.migrations import downgrade, status, upgrade
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m db.migrations")
+    parser.add_argument("command", choices=["status", "upgrade", "downgrade"])
+    parser.add_argument("--target", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.target)
+        print(f"Applied: {applied}" if applied else "Already up to date")
+    elif args.command == "downgrade":
+        if args.target is None:
+            parser.error("downgrade requires --target")
+        reverted = downgrade(engine, args.target)
+        print(f"Reverted: {reverted}" if reverted else "Nothing to revert")
+    else:
+        for row in status(engine):
+            mark = "x" if row["applied"] else " "
+            print(f"[{mark}] {row['version']:04d} {row['description']}")
+
+
+if __name__ == "__main__":
+    main()
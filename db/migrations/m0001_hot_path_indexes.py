@@ -0,0 +1,22 @@
+from db.migrations.ops import create_index, drop_index
+
+VERSION = 1
+DESCRIPTION = "Add indexes for user_id / date lookups on hot paths"
+
+# (インデックス名, テーブル, カラム)
+INDEXES = [
+    ("ix_team_members_user_id", "team_members", ["user_id"]),
+    ("ix_status_table_user_id", "status_table", ["user_id"]),
+    ("ix_test_results_user_category_created", "test_results", ["user_id", "category", "created_at"]),
+    ("ix_quizzes_date", "quizzes", ["date"]),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
+
+
+def downgrade(conn):
+    for name, table, _ in reversed(INDEXES):
+        drop_index(conn, name, table)
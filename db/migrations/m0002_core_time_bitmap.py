@@ -0,0 +1,25 @@
+from sqlalchemy import text
+
+from db.migrations.ops import column_exists
+
+VERSION = 2
+DESCRIPTION = "Add user_master.core_time_bitmap and backfill it from core_time"
+
+
+def upgrade(conn):
+    from utils.availability import parse_core_time, to_hex
+
+    if not column_exists(conn, "user_master", "core_time_bitmap"):
+        conn.execute(text("ALTER TABLE user_master ADD COLUMN core_time_bitmap VARCHAR(42)"))
+
+    rows = conn.execute(text("SELECT user_id, core_time FROM user_master")).all()
+    for user_id, core_time in rows:
+        conn.execute(
+            text("UPDATE user_master SET core_time_bitmap = :bitmap WHERE user_id = :user_id"),
+            {"bitmap": to_hex(parse_core_time(core_time)), "user_id": user_id},
+        )
+
+
+def downgrade(conn):
+    if column_exists(conn, "user_master", "core_time_bitmap"):
+        conn.execute(text("ALTER TABLE user_master DROP COLUMN core_time_bitmap"))
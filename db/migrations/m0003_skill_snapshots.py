@@ -0,0 +1,40 @@
+from sqlalchemy import text
+
+from db.migrations.ops import table_exists, create_index
+
+VERSION = 3
+DESCRIPTION = "Add user_skill_snapshots and team_skill_snapshots for precomputed skills"
+
+
+def upgrade(conn):
+    if not table_exists(conn, "user_skill_snapshots"):
+        conn.execute(text(
+            "CREATE TABLE user_skill_snapshots ("
+            " user_id VARCHAR(50) NOT NULL PRIMARY KEY,"
+            " has_status BOOLEAN NOT NULL,"
+            " biz INTEGER NOT NULL,"
+            " design INTEGER NOT NULL,"
+            " tech INTEGER NOT NULL,"
+            " computed_at DATETIME NOT NULL)"
+        ))
+    if not table_exists(conn, "team_skill_snapshots"):
+        conn.execute(text(
+            "CREATE TABLE team_skill_snapshots ("
+            " team_id INTEGER NOT NULL PRIMARY KEY,"
+            " member_count INTEGER NOT NULL,"
+            " biz_total INTEGER NOT NULL,"
+            " design_total INTEGER NOT NULL,"
+            " tech_total INTEGER NOT NULL,"
+            " balance FLOAT NOT NULL,"
+            " computed_at DATETIME NOT NULL)"
+        ))
+    # 鮮度(最も古い computed_at)の確認用
+    create_index(conn, "ix_user_skill_snapshots_computed_at", "user_skill_snapshots", ["computed_at"])
+    create_index(conn, "ix_team_skill_snapshots_computed_at", "team_skill_snapshots", ["computed_at"])
+
+
+def downgrade(conn):
+    # 派生データのみなので削除しても再計算で復元できる
+    for table in ("team_skill_snapshots", "user_skill_snapshots"):
+        if table_exists(conn, table):
+            conn.execute(text(f"DROP TABLE {table}"))
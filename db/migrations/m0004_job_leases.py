@@ -0,0 +1,21 @@
+from sqlalchemy import text
+
+from db.migrations.ops import table_exists
+
+VERSION = 4
+DESCRIPTION = "Add job_leases so only one worker runs each periodic job"
+
+
+def upgrade(conn):
+    if not table_exists(conn, "job_leases"):
+        conn.execute(text(
+            "CREATE TABLE job_leases ("
+            " name VARCHAR(50) NOT NULL PRIMARY KEY,"
+            " owner VARCHAR(100) NOT NULL,"
+            " expires_at DATETIME NOT NULL)"
+        ))
+
+
+def downgrade(conn):
+    if table_exists(conn, "job_leases"):
+        conn.execute(text("DROP TABLE job_leases"))
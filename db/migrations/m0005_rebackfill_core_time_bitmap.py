@@ -0,0 +1,25 @@
+from sqlalchemy import text
+
+from db.migrations.ops import column_exists
+
+VERSION = 5
+DESCRIPTION = "Recompute user_master.core_time_bitmap with the parser that reads N時以降, 夜 and trailing days"
+
+
+def upgrade(conn):
+    # 0002 で保存したビットマップは「22時以降」などを空として保存していたため、すべて計算し直す
+    from utils.availability import parse_core_time, to_hex
+
+    if not column_exists(conn, "user_master", "core_time_bitmap"):
+        return
+    rows = conn.execute(text("SELECT user_id, core_time FROM user_master")).all()
+    for user_id, core_time in rows:
+        conn.execute(
+            text("UPDATE user_master SET core_time_bitmap = :bitmap WHERE user_id = :user_id"),
+            {"bitmap": to_hex(parse_core_time(core_time)), "user_id": user_id},
+        )
+
+
+def downgrade(conn):
+    # 計算し直した値は新しい解釈のほうが正しいので戻さない
+    pass
@@ -0,0 +1,20 @@
+from sqlalchemy import text
+
+from db.migrations.ops import column_exists
+
+VERSION = 6
+DESCRIPTION = "Add invalidated_at to skill snapshots so writes expire them for every worker"
+
+TABLES = ("user_skill_snapshots", "team_skill_snapshots")
+
+
+def upgrade(conn):
+    for table in TABLES:
+        if not column_exists(conn, table, "invalidated_at"):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN invalidated_at DATETIME NULL"))
+
+
+def downgrade(conn):
+    for table in TABLES:
+        if column_exists(conn, table, "invalidated_at"):
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN invalidated_at"))
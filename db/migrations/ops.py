@@ -0,0 +1,27 @@
+from sqlalchemy import inspect, text
+
+
+def table_exists(conn, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def index_exists(conn, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(conn).get_indexes(table))
+
+
+def column_exists(conn, table: str, name: str) -> bool:
+    return any(column["name"] == name for column in inspect(conn).get_columns(table))
+
+
+def create_index(conn, name: str, table: str, columns):
+    """インデックスが無ければ作成する(手作業で作成済みの環境でも流せるように)"""
+    if not index_exists(conn, table, name):
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+def drop_index(conn, name: str, table: str):
+    if index_exists(conn, table, name):
+        if conn.dialect.name == "mysql":
+            conn.execute(text(f"DROP INDEX {name} ON {table}"))
+        else:
+            conn.execute(text(f"DROP INDEX {name}"))
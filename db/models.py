@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, TIMESTAMP, ForeignKey, Table, Text, Date
+from sqlalchemy import Column, Integer, String, DateTime, TIMESTAMP, ForeignKey, Table, Text, Date, Index, Boolean, Float
 from sqlalchemy.orm import relationship
 from db.database import Base
 from sqlalchemy.schema import PrimaryKeyConstraint
@@ -27,6 +27,8 @@ class UserMaster(Base):
     password = Column(String(100), nullable=False)
     avatar_url = Column(String(255))
     core_time = Column(String(50))
+    # core_timeを解析した週単位の空き時間ビットマップ(16進、utils/availability.py参照)
+    core_time_bitmap = Column(String(42))
 
     specialties = relationship("Specialty", secondary=user_specialties, back_populates="users")
     orientations = relationship("Orientation", secondary=user_orientations, back_populates="users")
@@ -49,7 +51,7 @@ class StatusTable(Base):
     __tablename__ = "status_table"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String(50), ForeignKey('user_master.user_id'), nullable=False)
+    user_id = Column(String(50), ForeignKey('user_master.user_id'), nullable=False, index=True)
     biz = Column(Integer, nullable=False)
     design = Column(Integer, nullable=False)
     tech = Column(Integer, nullable=False)
@@ -67,7 +69,7 @@ class TeamMember(Base):
     
     team_id = Column(Integer, ForeignKey('team.id'), nullable=False)
     role = Column(String(10), nullable=False)
-    user_id = Column(String(50), ForeignKey('user_master.user_id'), nullable=False)
+    user_id = Column(String(50), ForeignKey('user_master.user_id'), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -88,7 +90,7 @@ class Quiz(Base):
     correct_index = Column(Integer, nullable=False)
     explanation = Column(Text, nullable=False)
     category = Column(String(50), nullable=False)
-    date = Column(Date, nullable=False)
+    date = Column(Date, nullable=False, index=True)
 
 class TestResult(Base):
     __tablename__ = "test_results"
@@ -99,5 +101,46 @@ class TestResult(Base):
     correct_answers = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # インデックスの追加・変更は db/migrations にもマイグレーションを追加すること
+    __table_args__ = (
+        Index('ix_test_results_user_category_created', 'user_id', 'category', 'created_at'),
+    )
+
     user = relationship("UserMaster", back_populates="test_results")
-    specialty = relationship("Specialty")
\ No newline at end of file
+    specialty = relationship("Specialty")
+
+
+# 以下はバックグラウンドで再計算する派生データ(utils/precompute.py参照)
+class UserSkillSnapshot(Base):
+    __tablename__ = "user_skill_snapshots"
+
+    user_id = Column(String(50), primary_key=True)
+    # StatusTableの行があるか(ない場合 /api/user/skills は404)
+    has_status = Column(Boolean, nullable=False)
+    biz = Column(Integer, nullable=False)
+    design = Column(Integer, nullable=False)
+    tech = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, nullable=False, index=True)
+    # 書き込みで無効にした時刻。これより前に計算を始めたスナップショットは使わない
+    invalidated_at = Column(DateTime, nullable=True)
+
+class TeamSkillSnapshot(Base):
+    __tablename__ = "team_skill_snapshots"
+
+    team_id = Column(Integer, primary_key=True, autoincrement=False)
+    member_count = Column(Integer, nullable=False)
+    biz_total = Column(Integer, nullable=False)
+    design_total = Column(Integer, nullable=False)
+    tech_total = Column(Integer, nullable=False)
+    # 3スキル合計の最小値 / 最大値(1に近いほどバランスが良い)
+    balance = Column(Float, nullable=False)
+    computed_at = Column(DateTime, nullable=False, index=True)
+    invalidated_at = Column(DateTime, nullable=True)
+
+class JobLease(Base):
+    """複数ワーカーのうち1つだけが実行する定期処理の実行権"""
+    __tablename__ = "job_leases"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
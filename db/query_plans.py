@@ -0,0 +1,173 @@
+"""
+各ルーターの主要クエリがフルスキャンにならないことを SQLite の EXPLAIN QUERY PLAN で確認する。
+
+ルーターの読み込み関数(load_team_rosters・_load_skill_data など)を少量のデータに対して
+実際に呼び出し、発行されたSELECT文をそのまま EXPLAIN するため、クエリを変更しても
+ここを書き直す必要はない。インデックスを含まないテーブル定義を作成してから
+db/migrations を適用するため、マイグレーションでインデックスが作られていることも合わせて確認できる。
+
+    python -m db.query_plans
+
+フルスキャンになるクエリがあれば一覧を出力して終了コード1で終了する。
+"""
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from db import migrations
+from db.database import Base
+from db.models import (
+    Orientation, Quiz, Specialty, StatusTable, Team, TeamMember, TeamSkillSnapshot, TestResult, UserMaster,
+    UserSkillSnapshot,
+)
+from routers import analytics_router, quiz_router, team_router, test_router, user_router
+from utils.precompute import compute_team_summaries, compute_user_skills, precompute
+
+SAMPLE_CUTOFF = datetime(2024, 1, 1)
+
+# 件数が少なく、全件を読み込んでキャッシュするテーブル
+MASTER_TABLES = {"specialty", "orientation"}
+
+# (ルーター, 読み込み関数, 呼び出し)。u1 はスナップショットあり、u2・u3 はなし(その場で計算する経路)
+HOT_LOADERS = [
+    ("user_router", "_load_profile", lambda db: user_router._load_profile(db, "u1")),
+    ("user_router", "_load_skill_data (snapshot)", lambda db: user_router._load_skill_data(db, "u1", None)),
+    ("user_router", "_load_skill_data (live)", lambda db: user_router._load_skill_data(db, "u2", None)),
+    ("user_router", "_load_skill_data (date)", lambda db: user_router._load_skill_data(db, "u2", "2024-01-01")),
+    ("user_router", "_load_current_skills", lambda db: user_router._load_current_skills(db, "u2")),
+    ("user_router", "_load_team", lambda db: user_router._load_team(db, "u1")),
+    ("user_router", "_load_quiz_dates", user_router._load_quiz_dates),
+    ("team_router", "load_team_rosters", lambda db: team_router.load_team_rosters(db, [1, 2])),
+    ("team_router", "load_team_rosters (summary)", lambda db: team_router.load_team_rosters(db, [1, 2], "summary")),
+    ("team_router", "_load_team_roster", lambda db: team_router._load_team_roster(db, 1)),
+    ("team_router", "get_team_summary: snapshot", lambda db: precompute.fresh_team_snapshot(db, 1)),
+    ("team_router", "get_team_summary: live", lambda db: compute_team_summaries(db, [2])),
+    ("quiz_router", "_load_all_dates", quiz_router._load_all_dates),
+    ("quiz_router", "_load_questions", lambda db: quiz_router._load_questions(db, date(2024, 1, 1))),
+    ("test_router", "_load_categories", test_router._load_categories),
+    ("test_router", "_load_test_results", lambda db: test_router._load_test_results(db, "u1")),
+    ("analytics_router", "_load_cohort (team)", lambda db: analytics_router._load_cohort(db, None, 1)),
+    ("analytics_router", "_load_results", lambda db: analytics_router._load_results(db, ["u1", "u2"], True, SAMPLE_CUTOFF)),
+    ("precompute", "compute_user_skills", lambda db: compute_user_skills(db, ["u1", "u2", "u3"])),
+]
+
+
+def seed(engine):
+    """各読み込み関数のすべての分岐を通る最小限のデータ"""
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        db.add_all([Specialty(specialty=name) for name in ("Biz", "Design", "Tech")])
+        leader = Orientation(orientation="leader")
+        for user_id in ("u1", "u2", "u3"):
+            user = UserMaster(user_id=user_id, name=user_id, password="x", core_time="平日 19:00-22:00")
+            user.orientations = [leader]
+            db.add(user)
+            db.add(StatusTable(user_id=user_id, biz=1, design=1, tech=1))
+            db.add(TestResult(user_id=user_id, category="Tech", correct_answers=1, created_at=datetime(2023, 12, 1)))
+        db.add_all([Team(id=1, name="t1"), Team(id=2, name="t2")])
+        db.add_all([
+            TeamMember(team_id=1, role="PdM", user_id="u1"),
+            TeamMember(team_id=1, role="Tech", user_id="u2"),
+            TeamMember(team_id=2, role="Biz", user_id="u3"),
+        ])
+        db.add(Quiz(question_text="q", options="[]", correct_index=0, explanation="", category="Tech",
+                    date=date(2024, 1, 1)))
+        db.add(UserSkillSnapshot(user_id="u1", has_status=True, biz=1, design=1, tech=1, computed_at=now))
+        db.add(TeamSkillSnapshot(team_id=1, member_count=2, biz_total=2, design_total=2, tech_total=2, balance=1.0,
+                                 computed_at=now))
+        db.commit()
+
+
+def capture(engine, loader) -> list:
+    """loader(db) の実行中に発行されたSELECT文とパラメータ"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with Session(engine) as db:
+            loader(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def is_full_scan(detail: str) -> bool:
+    """
+    「SCAN <table>」はフルスキャン。ただしカバリングインデックスのみを読む場合と、
+    全件を読んでキャッシュする前提の小さなマスタテーブルは許容する
+    """
+    if not detail.startswith("SCAN ") or "USING COVERING INDEX" in detail:
+        return False
+    return detail.split()[1] not in MASTER_TABLES
+
+
+def build_engine():
+    """インデックスなしのテーブルを作成し、マイグレーションを適用したSQLiteエンジンを返す"""
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            conn.execute(CreateTable(table))
+    migrations.upgrade(engine)
+    seed(engine)
+    return engine
+
+
+def explain(conn, statement: str, parameters) -> list:
+    return [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+def find_full_scans(engine) -> tuple:
+    """フルスキャンになったクエリの一覧と、確認したクエリの数を返す"""
+    failures = []
+    checked = 0
+    for router, name, loader in HOT_LOADERS:
+        statements = capture(engine, loader)
+        checked += len(statements)
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = explain(conn, statement, parameters)
+                if any(is_full_scan(detail) for detail in plan):
+                    failures.append({"router": router, "query": name, "sql": statement, "plan": plan})
+    return failures, checked
+
+
+def find_missing_indexes(engine) -> list:
+    """models.py に定義されているがマイグレーションで作成されていないインデックス"""
+    inspector = inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and not all(c.primary_key for c in index.columns):
+                missing.append(f"{table.name}.{index.name}")
+    return missing
+
+
+def main() -> int:
+    engine = build_engine()
+    failures, checked = find_full_scans(engine)
+    missing = find_missing_indexes(engine)
+
+    for failure in failures:
+        print(f"FULL SCAN [{failure['router']}] {failure['query']}")
+        print(f"    {' '.join(failure['sql'].split())}")
+        for detail in failure["plan"]:
+            print(f"    {detail}")
+    for name in missing:
+        print(f"MISSING MIGRATION for index {name}")
+
+    if failures or missing:
+        return 1
+    print(f"OK: {checked} queries from {len(HOT_LOADERS)} loaders use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,20 +11,50 @@ from routers.user_router import router as user_router
 from routers.team_router import router as team_router
 from routers.quiz_router import router as quiz_router
 from routers.test_router import router as test_router
+from routers.analytics_router import router as analytics_router
+from routers.leaderboard_router import router as leaderboard_router
+from routers.system_router import router as system_router
+from routers.export_router import router as export_router
 from db.config import ALLOWED_ORIGINS
+from utils.rate_limit import AdmissionControlMiddleware
+from utils.http_cache import ConditionalResponseMiddleware
 import logging
 
-from slack_utils import send_message_to_slack, get_messages_from_slack
+from slack_utils import get_messages_from_slack
+from slack_outbox import outbox, enqueue_message, enqueue_reaction, enqueue_reply, run_dispatcher
+from utils.precompute import precompute
+from contextlib import asynccontextmanager
+import asyncio
 from pydantic import BaseModel
 from typing import List, Optional
 import sqlite3
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Slack送信キューのディスパッチャーと、スキルのスナップショットの再計算を起動
+    stop_event = asyncio.Event()
+    dispatcher = asyncio.create_task(run_dispatcher(stop_event))
+    scheduler = asyncio.create_task(precompute.run(stop_event))
+    try:
+        yield
+    finally:
+        stop_event.set()
+        await dispatcher
+        await scheduler
+
+app = FastAPI(lifespan=lifespan)
 
 # ログの設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ETag付与・304応答・レスポンス圧縮(受付制御の内側で動かす)
+app.add_middleware(ConditionalResponseMiddleware)
+
+# 受付制御(レート制限・同時実行数制限)
+# 後から追加したミドルウェアほど外側になるため、拒否レスポンスにもCORSヘッダーが付くよう先に追加する
+app.add_middleware(AdmissionControlMiddleware)
+
 # CORSミドルウェアの設定
 ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "").split(",")
 app.add_middleware(
@@ -33,6 +63,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 書き込み後にプライマリから読む期限(db/database.py参照)
+    expose_headers=["X-Primary-Until"],
 )
 
 # セキュリティスキームの定義
@@ -44,6 +76,10 @@ app.include_router(user_router)
 app.include_router(team_router)
 app.include_router(quiz_router)
 app.include_router(test_router)
+app.include_router(analytics_router)
+app.include_router(leaderboard_router)
+app.include_router(system_router)
+app.include_router(export_router)
 
 # OpenAPI スキーマのカスタマイズ
 def custom_openapi():
@@ -123,13 +159,12 @@ def query_database(query: str, params: tuple) -> List[dict]:
     return [dict(row) for row in rows]
 
 # Slack関連のエンドポイント
-@app.post("/send_message/")
+# 送信はキューに積んで202を返し、バックグラウンドで送る(結果は /slack_jobs/{job_id} で確認)
+@app.post("/send_message/", status_code=202)
 async def send_message(message: Message):
     print("Received text:", message.text)  # 受け取ったテキストを表示
-    response = send_message_to_slack(message.text)
-    if not response.get("ok"):
-        raise HTTPException(status_code=400, detail=response.get("error", "Unknown error"))
-    return {"status": "Message sent", "data": response}
+    job_id = await asyncio.to_thread(enqueue_message, message.text)
+    return {"status": "Message queued", "job_id": job_id}
 
 @app.get("/get_messages/")
 async def get_messages():
@@ -142,21 +177,24 @@ async def get_messages():
     print("Response data:", response["data"])  # 取得したデータの確認
     return {"status": "Messages retrieved", "data": response["data"]}
 
-@app.post("/add_reaction/")
+@app.post("/add_reaction/", status_code=202)
 async def add_reaction(reaction: Reaction):
     print("Received Reaction Data:", reaction)  # 受け取ったデータをログに表示
-    response = add_reaction_to_message(reaction.channel, reaction.timestamp, reaction.emoji)
-    if not response.get("ok"):
-        raise HTTPException(status_code=400, detail=response.get("error", "Unknown error"))
-    return {"status": "Reaction added", "data": response}
+    job_id = await asyncio.to_thread(enqueue_reaction, reaction.channel, reaction.timestamp, reaction.emoji)
+    return {"status": "Reaction queued", "job_id": job_id}
 
 
-@app.post("/send_reply/")
+@app.post("/send_reply/", status_code=202)
 async def send_reply(reply: Reply):
-    response = reply_to_message(reply.channel, reply.thread_ts, reply.text)
-    if not response.get("ok"):
-        raise HTTPException(status_code=400, detail=response.get("error", "Unknown error"))
-    return {"status": "Reply sent", "data": response}
+    job_id = await asyncio.to_thread(enqueue_reply, reply.channel, reply.thread_ts, reply.text)
+    return {"status": "Reply queued", "job_id": job_id}
+
+@app.get("/slack_jobs/{job_id}")
+async def get_slack_job(job_id: int):
+    job = await asyncio.to_thread(outbox.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # ユーザー検索エンドポイント
 @app.get("/users/")
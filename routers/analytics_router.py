@@ -0,0 +1,195 @@
+from fastapi import APIRouter, Depends, HTTPException, Security, Query, Response
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from db.database import get_read_db
+from db.models import UserMaster, TeamMember, TestResult
+from utils.security import verify_token
+from utils.skills import GROWTH_PER_CORRECT, SKILL_KEYS, load_base_status
+from jose import JWTError
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from datetime import datetime, timedelta
+import numpy as np
+import json
+import struct
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+bearer_scheme = HTTPBearer()
+
+# 1リクエストで集計できる最大日数
+MAX_DAYS = 731
+DEFAULT_DAYS = 30
+
+# ユーザー数 × 日数の上限(スキルごとにこの要素数の配列を作る)
+MAX_CELLS = 4_000_000
+
+SECONDS_PER_DAY = 86400
+
+# 行列の返し方。binary は application/octet-stream で、先頭4バイト(little-endian)がヘッダーJSONの長さ、
+# 続いてヘッダーJSON、その後にスキルごとの配列(ヘッダーの dtype、users × dates の行優先)を並べたもの
+ENCODINGS = ("json", "binary")
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+# binary で使う型(値が収まる最も小さい型を選ぶ)
+BINARY_DTYPES = ("<u1", "<u2", "<i4")
+
+
+def _parse_date(value: str, name: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} format. Use YYYY-MM-DD.")
+
+
+def compute_skill_trajectories(user_ids, base, results, start: datetime, n_days: int) -> dict:
+    """
+    ユーザー×日ごとの累積スキルをNumPyで一括計算する。
+
+    日付dの値は /api/user/skills?date=d と同じく created_at <= d 00:00:00 までの
+    test_resultsを集計したもの。
+    """
+    user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+    category_index = {key: i for i, key in enumerate(SKILL_KEYS)}
+
+    grid = np.zeros((len(SKILL_KEYS), len(user_ids), n_days), dtype=np.int64)
+
+    rows = [
+        (category_index[r.category.lower()], user_index[r.user_id], r.correct_answers, r.created_at)
+        for r in results
+        if r.created_at is not None
+        and r.user_id in user_index
+        and r.category.lower() in category_index
+    ]
+    if rows:
+        cat_idx, usr_idx, correct, created = zip(*rows)
+        created = np.array(created, dtype="datetime64[s]")
+        offsets = (created - np.datetime64(start, "s")).astype(np.int64)
+        # 当日0時ちょうどの結果はその日に、それ以外は翌日から反映される
+        day_idx = np.clip(-(-offsets // SECONDS_PER_DAY), 0, None)
+        in_range = day_idx < n_days
+        np.add.at(
+            grid,
+            (np.asarray(cat_idx)[in_range], np.asarray(usr_idx)[in_range], day_idx[in_range]),
+            np.asarray(correct, dtype=np.int64)[in_range],
+        )
+
+    np.cumsum(grid, axis=2, out=grid)
+    grid *= GROWTH_PER_CORRECT
+
+    base_grid = np.array(
+        [[base.get(user_id, {}).get(key, 0) for user_id in user_ids] for key in SKILL_KEYS],
+        dtype=np.int64,
+    ).reshape(len(SKILL_KEYS), len(user_ids), 1)
+    grid += base_grid
+
+    return {key: grid[i] for i, key in enumerate(SKILL_KEYS)}
+
+
+def _binary_dtype(trajectories) -> str:
+    low = min((int(trajectories[key].min()) for key in SKILL_KEYS if trajectories[key].size), default=0)
+    high = max((int(trajectories[key].max()) for key in SKILL_KEYS if trajectories[key].size), default=0)
+    for dtype in BINARY_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return "<i8"
+
+
+def serialize_trajectories(dates, user_ids, trajectories, encoding: str = "json") -> bytes:
+    """
+    レスポンスの本文を直接作る。数百万要素の配列を jsonable_encoder に通すと
+    要素ごとにPythonの処理が走り、計算そのものより何倍も遅くなるため。
+    """
+    payload = {"dates": dates, "user_ids": user_ids, "encoding": encoding}
+    if encoding == "binary":
+        dtype = _binary_dtype(trajectories)
+        payload.update(shape=[len(user_ids), len(dates)], dtype=dtype, skills=list(SKILL_KEYS))
+        header = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        return b"".join(
+            [struct.pack("<I", len(header)), header]
+            + [trajectories[key].astype(dtype, copy=False).tobytes() for key in SKILL_KEYS]
+        )
+    for key in SKILL_KEYS:
+        payload[key] = trajectories[key].tolist()
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _load_cohort(db: Session, user_ids, team_id):
+    """対象ユーザー(指定がなければ全ユーザー)"""
+    if user_ids:
+        return sorted(set(user_ids))
+    if team_id is not None:
+        return sorted({m.user_id for m in db.query(TeamMember.user_id).filter(TeamMember.team_id == team_id).all()})
+    return [u.user_id for u in db.query(UserMaster.user_id).order_by(UserMaster.user_id).all()]
+
+
+def _load_results(db: Session, cohort, scoped: bool, end_date: datetime):
+    """期間末までのtest_results(scoped=False の場合は全ユーザー分)"""
+    query = db.query(
+        TestResult.user_id,
+        TestResult.category,
+        TestResult.correct_answers,
+        TestResult.created_at
+    ).filter(TestResult.created_at <= end_date)
+    if scoped:
+        query = query.filter(TestResult.user_id.in_(cohort))
+    return query.all()
+
+
+@router.get("/api/analytics/skills")
+def get_cohort_skill_trajectories(
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    user_ids: Optional[List[str]] = Query(None),
+    team_id: Optional[int] = Query(None),
+    encoding: str = Query("json"),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_read_db)
+):
+    try:
+        payload = verify_token(credentials.credentials)
+        if payload.get("sub") is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        end_date = _parse_date(end, "end") if end else datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        start_date = _parse_date(start, "start") if start else end_date - timedelta(days=DEFAULT_DAYS - 1)
+        n_days = (end_date - start_date).days + 1
+        if n_days <= 0:
+            raise HTTPException(status_code=400, detail="start must be on or before end.")
+        if n_days > MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range must be {MAX_DAYS} days or less.")
+        if encoding not in ENCODINGS:
+            raise HTTPException(status_code=400, detail=f"Invalid encoding. Use one of: {', '.join(ENCODINGS)}")
+
+        # コホートの決定(指定がなければ全ユーザー)
+        scoped = bool(user_ids) or team_id is not None
+        cohort = _load_cohort(db, user_ids, team_id)
+
+        media_type = BINARY_MEDIA_TYPE if encoding == "binary" else "application/json"
+        if not cohort:
+            empty = {key: np.zeros((0, 0), dtype=np.int64) for key in SKILL_KEYS}
+            return Response(serialize_trajectories([], [], empty, encoding), media_type=media_type)
+        if len(cohort) * n_days > MAX_CELLS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"users x days must be {MAX_CELLS} or less. Narrow the date range or the cohort.",
+            )
+
+        # 一括読み込み(ステータスと期間末までのtest_results)
+        base = load_base_status(db, cohort if scoped else None)
+        results = _load_results(db, cohort, scoped, end_date)
+
+        trajectories = compute_skill_trajectories(cohort, base, results, start_date, n_days)
+
+        # 列指向の形式で返す(各スキルは users × dates の2次元配列)
+        dates = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(n_days)]
+        return Response(serialize_trajectories(dates, cohort, trajectories, encoding), media_type=media_type)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in get_cohort_skill_trajectories: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
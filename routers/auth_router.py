@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
-from db.database import get_db
+from db.database import get_read_db
 from db.models import UserMaster
 from utils.security import create_access_token
 from db.config import SECRET_KEY, ALGORITHM
@@ -24,7 +24,7 @@ class LoginResponse(BaseModel):
     name: str
 
 @router.post("/api/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+def login(request: LoginRequest, db: Session = Depends(get_read_db)):
     user = db.query(UserMaster).filter(UserMaster.user_id == request.user_id).first()
     if not user or not pwd_context.verify(request.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
@@ -0,0 +1,364 @@
+from fastapi import APIRouter, HTTPException, Security, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_
+from typing import Optional
+
+from db.database import open_read_session, ReadSessionLocal
+from db.models import UserMaster, Team, TeamMember, TestResult, user_specialties, user_orientations
+from utils.security import verify_token
+from jose import JWTError
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from datetime import datetime, timedelta, timezone
+import csv
+import io
+import json
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrowが入っていない環境ではParquet出力は使えない
+    pa = None
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+bearer_scheme = HTTPBearer()
+
+# サーバーサイドカーソルから一度に取り出す行数(Parquetでは1行グループの行数)
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# 差分エクスポートで since より前に遡って再出力する秒数。
+# DATETIME は秒単位で、updated_at はコミット前にアプリ側で設定されるため、
+# ウォーターマークと同じ秒やそれより前の時刻でコミットされた行を取りこぼさないようにする
+EXPORT_OVERLAP_SECONDS = 60
+# テスト結果の差分で since_id より前に遡って再出力する件数。
+# id は INSERT 時に採番されコミット順とは一致しないため、ウォーターマークより小さい id の行が
+# 後からコミットされることがある。その行を次回の差分で拾えるようにする
+EXPORT_OVERLAP_IDS = 1000
+
+# エクスポートごとの列 (列名, 型)。型は "string" / "int" / "datetime" / "list"
+USER_COLUMNS = [
+    ("user_id", "string"), ("name", "string"), ("avatar_url", "string"), ("core_time", "string"),
+    ("specialties", "list"), ("orientations", "list"),
+]
+TEAM_MEMBER_COLUMNS = [
+    ("team_id", "int"), ("team_name", "string"), ("role", "string"), ("user_id", "string"),
+    ("user_name", "string"), ("created_at", "datetime"), ("updated_at", "datetime"),
+]
+TEST_RESULT_COLUMNS = [
+    ("id", "int"), ("user_id", "string"), ("category", "string"), ("correct_answers", "int"),
+    ("created_at", "datetime"),
+]
+
+
+def _authenticate(credentials: HTTPAuthorizationCredentials):
+    payload = verify_token(credentials.credentials)
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def _check_format(format: str):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(EXPORT_MEDIA_TYPES)}")
+    if format == "parquet" and pa is None:
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+
+
+def _parse_since(since: Optional[str]):
+    if since is None:
+        return None
+    try:
+        value = datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since format. Use ISO 8601 (YYYY-MM-DDTHH:MM:SS).")
+    # DBの時刻はUTC(タイムゾーンなし)で保存している
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _stream_rows(db: Session, stmt):
+    """yield_per(サーバーサイドカーソル)で EXPORT_BATCH_SIZE 行ずつ取り出す"""
+    result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        yield rows
+
+
+def _grouped(db: Session, key_column, value_column, keys) -> dict:
+    grouped = {}
+    rows = db.execute(select(key_column, value_column).where(key_column.in_(keys)).order_by(key_column, value_column))
+    for key, value in rows:
+        grouped.setdefault(key, []).append(value)
+    return grouped
+
+
+def _user_batches(db: Session):
+    stmt = select(
+        UserMaster.user_id, UserMaster.name, UserMaster.avatar_url, UserMaster.core_time
+    ).order_by(UserMaster.user_id)
+    # カーソルを開いている接続では別のクエリを実行できないため、専門・志向は別の接続で引く
+    lookup_db = ReadSessionLocal(bind=db.get_bind())
+    try:
+        for rows in _stream_rows(db, stmt):
+            user_ids = [row.user_id for row in rows]
+            specialties = _grouped(lookup_db, user_specialties.c.user_id, user_specialties.c.specialty, user_ids)
+            orientations = _grouped(lookup_db, user_orientations.c.user_id, user_orientations.c.orientation, user_ids)
+            yield [
+                {
+                    "user_id": row.user_id,
+                    "name": row.name,
+                    "avatar_url": row.avatar_url,
+                    "core_time": row.core_time,
+                    "specialties": specialties.get(row.user_id, []),
+                    "orientations": orientations.get(row.user_id, []),
+                }
+                for row in rows
+            ]
+    finally:
+        lookup_db.close()
+
+
+def _window(column, since, until):
+    """since より後、until(ウォーターマーク)以前の行。全件出力では値のない行も含める"""
+    conditions = [column <= until] if until is not None else []
+    if since is not None:
+        conditions.append(column > since)
+    elif conditions:
+        conditions = [or_(conditions[0], column.is_(None))]
+    return conditions
+
+
+def _watermark(db: Session, column, since):
+    """
+    出力範囲の上限を先に決めておき、出力中に追加された行は次回に回す。
+    (クエリの上限, 次回の since に使う値) を返す。
+    """
+    try:
+        until = db.query(func.max(column)).scalar()
+    except Exception:
+        db.close()
+        raise
+    if since is not None and (until is None or until < since):
+        return until, since
+    return until, until
+
+
+def _team_member_batches(db: Session, since, until):
+    stmt = select(
+        TeamMember.team_id, Team.name.label("team_name"), TeamMember.role, TeamMember.user_id,
+        UserMaster.name.label("user_name"), TeamMember.created_at, TeamMember.updated_at,
+    ).join(Team, Team.id == TeamMember.team_id).outerjoin(
+        UserMaster, UserMaster.user_id == TeamMember.user_id
+    ).where(*_window(
+        TeamMember.updated_at, since - timedelta(seconds=EXPORT_OVERLAP_SECONDS) if since else None, until
+    )).order_by(
+        TeamMember.updated_at, TeamMember.team_id, TeamMember.role
+    )
+    for rows in _stream_rows(db, stmt):
+        yield [dict(row._mapping) for row in rows]
+
+
+def _test_result_batches(db: Session, since, until):
+    stmt = select(
+        TestResult.id, TestResult.user_id, TestResult.category, TestResult.correct_answers, TestResult.created_at,
+    ).where(*_window(
+        TestResult.id, since - EXPORT_OVERLAP_IDS if since is not None else None, until
+    )).order_by(TestResult.id)
+    for rows in _stream_rows(db, stmt):
+        yield [dict(row._mapping) for row in rows]
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_ndjson(batches, columns):
+    for batch in batches:
+        yield "".join(
+            json.dumps({name: _json_value(row[name]) for name, _ in columns}, ensure_ascii=False) + "\n"
+            for row in batch
+        ).encode()
+
+
+def _encode_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow([name for name, _ in columns])
+    yield flush()
+    for batch in batches:
+        for row in batch:
+            writer.writerow([
+                # 複数値の列は "|" 区切りにする
+                "|".join(row[name]) if kind == "list" else _json_value(row[name])
+                for name, kind in columns
+            ])
+        yield flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """ParquetWriterの出力を受け取り、書かれた分だけ取り出せるようにする"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema(columns):
+    types = {
+        "string": pa.string(),
+        "int": pa.int64(),
+        "datetime": pa.timestamp("us"),
+        "list": pa.list_(pa.string()),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _encode_parquet(batches, columns):
+    # 1バッチを1行グループとして書き出し、書けた分から送る
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"ndjson": _encode_ndjson, "csv": _encode_csv, "parquet": _encode_parquet}
+
+
+def _export_response(db: Session, name: str, format: str, columns, batches, watermark=None):
+    """
+    ストリーミングで返すレスポンスを作る。セッションはジェネレーターが閉じる
+    (依存関係のセッションはレスポンス送信前に閉じられるため使わない)。
+    """
+    def stream():
+        try:
+            yield from ENCODERS[format](batches, columns)
+        except Exception as e:
+            logger.error(f"Unhandled error in export {name}: {e}")
+            raise
+        finally:
+            db.close()
+
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{format}"'}
+    if watermark is not None:
+        # 次回の差分エクスポートでは since にこの値を指定する
+        headers["X-Export-Watermark"] = watermark.isoformat() if isinstance(watermark, datetime) else str(watermark)
+    # 送信が始まる前に切断された場合もセッションを閉じる
+    return StreamingResponse(stream(), media_type=EXPORT_MEDIA_TYPES[format], headers=headers, background=BackgroundTask(db.close))
+
+
+@router.get("/api/export/users")
+def export_users(
+    format: str = Query("ndjson"),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
+):
+    """全ユーザーと専門・志向。ユーザーには更新時刻がないため常に全件出力"""
+    try:
+        _authenticate(credentials)
+        _check_format(format)
+
+        db = open_read_session()
+        return _export_response(db, "users", format, USER_COLUMNS, _user_batches(db))
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in export_users: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/export/team_members")
+def export_team_members(
+    format: str = Query("ndjson"),
+    since: Optional[str] = Query(None),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
+):
+    """
+    チームメンバー(チーム名・ユーザー名付き)。since を指定すると updated_at が
+    since - EXPORT_OVERLAP_SECONDS より後の行を出力する。遡った分は前回と重複するため、
+    受け取り側は (team_id, role) で上書きすること。
+    削除されたメンバーは差分には含まれないため、定期的に全件出力と突き合わせること。
+    """
+    try:
+        _authenticate(credentials)
+        _check_format(format)
+        since_at = _parse_since(since)
+
+        db = open_read_session()
+        until, watermark = _watermark(db, TeamMember.updated_at, since_at)
+        return _export_response(
+            db, "team_members", format, TEAM_MEMBER_COLUMNS, _team_member_batches(db, since_at, until), watermark
+        )
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in export_team_members: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/export/test_results")
+def export_test_results(
+    format: str = Query("ndjson"),
+    since_id: Optional[int] = Query(None, ge=0),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
+):
+    """
+    全ユーザーのテスト結果。since_id を指定すると id が since_id - EXPORT_OVERLAP_IDS より大きい行を出力する。
+    created_at はコミット前に設定され秒単位でしか保存されないため、差分の基準には id を使う。
+    id もコミット順ではないため遡った分を重複して出力する。受け取り側は id で上書きすること。
+    """
+    try:
+        _authenticate(credentials)
+        _check_format(format)
+
+        db = open_read_session()
+        until, watermark = _watermark(db, TestResult.id, since_id)
+        return _export_response(
+            db, "test_results", format, TEST_RESULT_COLUMNS, _test_result_batches(db, since_id, until), watermark
+        )
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in export_test_results: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,147 @@
+from fastapi import APIRouter, Depends, HTTPException, Security, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from db.database import get_db, run_on_primary
+from utils.security import verify_token
+from utils.leaderboard import leaderboard, METRICS
+from jose import JWTError
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+bearer_scheme = HTTPBearer()
+
+
+def _authenticate(credentials: HTTPAuthorizationCredentials) -> str:
+    payload = verify_token(credentials.credentials)
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
+
+
+def _check_metric(metric: str):
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Invalid metric. Use one of {', '.join(METRICS)}.")
+
+
+@router.get("/api/leaderboard")
+def get_leaderboard(
+    metric: str = Query("total"),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+):
+    try:
+        _authenticate(credentials)
+        _check_metric(metric)
+        # 全ユーザーで共有するランキングなので、遅延のあるレプリカからは作り直さない
+        run_on_primary(leaderboard.ensure_loaded)
+
+        return {
+            "metric": metric,
+            "total_users": leaderboard.size(),
+            "entries": leaderboard.top(metric, limit, offset),
+        }
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in get_leaderboard: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/leaderboard/rank")
+def get_leaderboard_rank(
+    metric: str = Query("total"),
+    user_id: Optional[str] = Query(None),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+):
+    try:
+        current_user_id = _authenticate(credentials)
+        _check_metric(metric)
+        run_on_primary(leaderboard.ensure_loaded)
+
+        # user_id未指定の場合は自分の順位
+        entry = leaderboard.rank(metric, user_id or current_user_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="User not ranked")
+
+        return {"metric": metric, "total_users": leaderboard.size(), **entry}
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in get_leaderboard_rank: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/leaderboard/neighborhood")
+def get_leaderboard_neighborhood(
+    metric: str = Query("total"),
+    user_id: Optional[str] = Query(None),
+    before: int = Query(5, ge=0, le=50),
+    after: int = Query(5, ge=0, le=50),
+    page: int = Query(0),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+):
+    try:
+        current_user_id = _authenticate(credentials)
+        _check_metric(metric)
+        run_on_primary(leaderboard.ensure_loaded)
+
+        entries = leaderboard.neighborhood(metric, user_id or current_user_id, before, after, page)
+        if entries is None:
+            raise HTTPException(status_code=404, detail="User not ranked")
+
+        return {"metric": metric, "total_users": leaderboard.size(), "page": page, "entries": entries}
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in get_leaderboard_neighborhood: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/api/leaderboard/rebuild")
+def rebuild_leaderboard(
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_db)
+):
+    try:
+        _authenticate(credentials)
+        # 再構築中なら重ねて実行せず、実行中の再構築に任せる
+        if not leaderboard.rebuild(db, blocking=False):
+            return {"message": "Leaderboard rebuild already in progress.", "total_users": leaderboard.size()}
+        return {"message": "Leaderboard rebuilt.", "total_users": leaderboard.size()}
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in rebuild_leaderboard: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/leaderboard/consistency")
+def check_leaderboard_consistency(
+    repair: bool = Query(False),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_db)
+):
+    try:
+        _authenticate(credentials)
+        leaderboard.ensure_loaded(db)
+        return leaderboard.check_consistency(db, repair=repair)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in check_leaderboard_consistency: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 from sqlalchemy.orm import Session
-from db.database import get_db
+from db.database import run_on_primary
 from db.models import Quiz
+from utils.cache import cache
 from typing import List
 from pydantic import BaseModel, validator
 from datetime import datetime, date
@@ -9,6 +10,9 @@ import json
 
 router = APIRouter()
 
+# クイズのキャッシュ保持時間(秒)
+QUIZ_CACHE_TTL = 600
+
 class QuizOut(BaseModel):
     id: int
     question_text: str
@@ -30,18 +34,29 @@ class QuizOut(BaseModel):
                 return []
         return v
 
-@router.get("/get_all_dates", response_model=List[str])
-def get_all_dates(db: Session = Depends(get_db)):
+def _load_all_dates(db: Session):
     dates = db.query(Quiz.date).distinct().all()
     return [date_tuple[0].isoformat() for date_tuple in dates]
 
+def _load_questions(db: Session, date_obj: date):
+    questions = db.query(Quiz).filter(Quiz.date == date_obj).all()
+    return [QuizOut.model_validate(q, from_attributes=True).model_dump() for q in questions]
+
+@router.get("/get_all_dates", response_model=List[str])
+def get_all_dates():
+    # クイズはほとんど更新されないので長めに保持する。
+    # 全員で共有するキャッシュなので、遅延のあるレプリカからは読み込まない
+    return cache.get_or_load(
+        "quiz:dates", lambda: run_on_primary(_load_all_dates), ttl=QUIZ_CACHE_TTL, tags=["quizzes"]
+    )
+
 @router.get("/get_questions_by_date/{selected_date}", response_model=List[QuizOut])
-def get_questions_by_date(selected_date: str, db: Session = Depends(get_db)):
+def get_questions_by_date(selected_date: str):
     try:
         date_obj = datetime.strptime(selected_date, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
 
-    questions = db.query(Quiz).filter(Quiz.date == date_obj).all()
-
-    return questions
+    return cache.get_or_load(
+        f"quiz:date:{date_obj.isoformat()}", lambda: run_on_primary(_load_questions, date_obj), ttl=QUIZ_CACHE_TTL, tags=["quizzes"]
+    )
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Security
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+from utils.security import verify_token
+from utils.rate_limit import limiter_stats
+from utils.http_cache import http_cache_stats
+from utils.cache import cache
+from utils.precompute import precompute
+from db.database import get_read_db
+from sqlalchemy.orm import Session
+
+router = APIRouter()
+bearer_scheme = HTTPBearer()
+
+def _authenticate(credentials: HTTPAuthorizationCredentials):
+    payload = verify_token(credentials.credentials)
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+# レート制限・同時実行数制限の状態
+@router.get("/api/system/limits")
+def get_limits(credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)):
+    _authenticate(credentials)
+    return limiter_stats()
+
+# ETag/圧縮による転送量削減の計測値
+@router.get("/api/system/http")
+def get_http_cache_stats(credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)):
+    _authenticate(credentials)
+    return http_cache_stats.snapshot()
+
+# アプリケーションキャッシュのヒット率など
+@router.get("/api/system/cache")
+def get_cache_stats(credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)):
+    _authenticate(credentials)
+    return cache.stats()
+
+# スナップショット再計算ジョブの実行状況と鮮度
+@router.get("/api/system/precompute")
+def get_precompute_stats(
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_read_db)
+):
+    _authenticate(credentials)
+    return precompute.stats(db)
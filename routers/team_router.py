@@ -1,19 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Security, Request, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
 
 from pydantic import BaseModel
-from db.database import get_db
-from db.models import UserMaster, StatusTable, TeamMember, Team, TestResult
+from db.database import get_db, get_read_db, run_on_primary
+from db.models import UserMaster, TeamMember, Team
 from utils.security import verify_token
+from utils.skills import SKILL_KEYS
+from utils.precompute import precompute, compute_team_summaries, expire_snapshots
+from utils.team_events import team_events, ALL_TEAMS, SubscriptionLimitError
+from utils.availability import availability_index
+from utils.cache import cache
 from jose import JWTError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from datetime import datetime
 from sqlalchemy import func
+import asyncio
+import json
 
 router = APIRouter()
 
 bearer_scheme = HTTPBearer()
 
+# SSE接続を維持するためのコメント送信間隔(秒)
+EVENT_HEARTBEAT_SECONDS = 15
+
 class AddTeamMemberRequest(BaseModel):
     team_id: int
     role: str
@@ -38,7 +51,13 @@ def add_team_member(
             user_id=request.user_id
         )
         db.add(new_member)
+        expire_snapshots(db, team_ids=[request.team_id])
         db.commit()
+
+        availability_index.invalidate_teams()
+        precompute.mark_team_dirty(request.team_id)
+        cache.invalidate_tags(f"team:{request.team_id}", f"user:{request.user_id}")
+        team_events.publish("member_added", request.team_id, role=request.role, user_id=request.user_id)
         return {"message": "Team member added successfully."}
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -68,8 +87,15 @@ def remove_team_member(
         if not member:
             raise HTTPException(status_code=404, detail="Member not found in this role.")
 
+        removed_user_id = member.user_id
         db.delete(member)
+        expire_snapshots(db, team_ids=[request.team_id])
         db.commit()
+
+        availability_index.invalidate_teams()
+        precompute.mark_team_dirty(request.team_id)
+        cache.invalidate_tags(f"team:{request.team_id}", f"user:{removed_user_id}")
+        team_events.publish("member_removed", request.team_id, role=request.role, user_id=removed_user_id)
         return {"message": "Team member removed successfully."}
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -77,54 +103,291 @@ def remove_team_member(
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/api/team/{team_id}")
-def get_team_info(
-    team_id: int,
+# バッチ取得で一度に指定できるチーム数の上限
+MAX_BATCH_TEAMS = 200
+
+def load_team_rosters(db: Session, team_ids, projection: str = "full") -> dict:
+    """
+    複数チームのメンバー情報を team_id -> メンバー一覧 で取得する。
+    メンバー・ユーザー・スキルはチーム数やメンバー数によらず一括のクエリで取得する。
+    projection="summary" の場合は role/user_id/name のみ返す。
+    """
+    team_ids = list(team_ids)
+    rosters = {team_id: [] for team_id in team_ids}
+    if not team_ids:
+        return rosters
+
+    members = db.query(TeamMember).filter(TeamMember.team_id.in_(team_ids)).all()
+    user_ids = list({member.user_id for member in members})
+
+    if projection == "summary":
+        names = dict(db.query(UserMaster.user_id, UserMaster.name).filter(UserMaster.user_id.in_(user_ids)).all())
+        for member in members:
+            rosters[member.team_id].append({
+                "role": member.role,
+                "user_id": member.user_id,
+                "name": names.get(member.user_id),
+            })
+        return rosters
+
+    users = {
+        user.user_id: user
+        for user in db.query(UserMaster).options(
+            selectinload(UserMaster.specialties),
+            selectinload(UserMaster.orientations)
+        ).filter(UserMaster.user_id.in_(user_ids)).all()
+    }
+    # 初期値(ステータスがない場合は0とする)に成長分を加算したスキル。計算済みのスナップショットがあれば使う
+    skills = precompute.load_current_skills(db, user_ids)
+
+    for member in members:
+        user = users.get(member.user_id)
+        user_skills = skills.get(member.user_id, {})
+        rosters[member.team_id].append({
+            "role": member.role,
+            "user_id": member.user_id,
+            "name": user.name if user else None,
+            "avatar_url": user.avatar_url if user else None,
+            "specialties": [s.specialty for s in user.specialties] if user else [],
+            "orientations": [o.orientation for o in user.orientations] if user else [],
+            "core_time": user.core_time if user else None,
+            "biz": user_skills.get("biz", 0),
+            "design": user_skills.get("design", 0),
+            "tech": user_skills.get("tech", 0),
+        })
+    return rosters
+
+# 複数チームのメンバー情報を一括取得
+# team_ids未指定の場合は全チームをページングして返す
+@router.get("/api/teams")
+def get_teams_batch(
+    team_ids: Optional[List[int]] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=MAX_BATCH_TEAMS),
+    projection: str = Query("full"),
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     try:
         payload = verify_token(credentials.credentials)
 
-        members = db.query(TeamMember).filter(TeamMember.team_id == team_id).all()
-        team_info = []
-        for member in members:
-            user = db.query(UserMaster).filter(UserMaster.user_id == member.user_id).first()
-            status = db.query(StatusTable).filter(StatusTable.user_id == member.user_id).first()
+        if projection not in ("full", "summary"):
+            raise HTTPException(status_code=400, detail="Invalid projection. Use 'full' or 'summary'.")
 
-            # test_resultsから成長分を取得
-            growth = db.query(
-                TestResult.category,
-                func.sum(TestResult.correct_answers).label("total_correct")
-            ).filter(TestResult.user_id == member.user_id).group_by(TestResult.category).all()
+        if team_ids:
+            if len(team_ids) > MAX_BATCH_TEAMS:
+                raise HTTPException(status_code=400, detail=f"team_ids must be {MAX_BATCH_TEAMS} or fewer.")
+            found = {team.id: team for team in db.query(Team).filter(Team.id.in_(team_ids)).all()}
+            # 指定された順序を保つ
+            teams = [found[team_id] for team_id in dict.fromkeys(team_ids) if team_id in found]
+            total = len(teams)
+        else:
+            total = db.query(func.count(Team.id)).scalar()
+            teams = db.query(Team).order_by(Team.id).offset(offset).limit(limit).all()
 
-            # 例:1正解につき+2で成長
-            growth_dict = {g.category.lower(): (g.total_correct * 2) for g in growth}
+        rosters = load_team_rosters(db, [team.id for team in teams], projection)
 
-            specialties = [s.specialty for s in user.specialties]
-            orientations = [o.orientation for o in user.orientations]
+        return {
+            "total": total,
+            "offset": 0 if team_ids else offset,
+            "limit": len(teams) if team_ids else limit,
+            "teams": [
+                {"team_id": team.id, "name": team.name, "members": rosters[team.id]}
+                for team in teams
+            ],
+        }
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-            # 初期値(ステータスがない場合は0とする)に成長分を加算
-            final_biz = (status.biz if status else 0) + growth_dict.get("biz",0)
-            final_design = (status.design if status else 0) + growth_dict.get("design",0)
-            final_tech = (status.tech if status else 0) + growth_dict.get("tech",0)
+# コアタイムが min_hours 時間以上重なるチームを検索
+# チームの空き時間はメンバー全員が空いている時間
+@router.get("/api/team/availability/match")
+def match_team_availability(
+    min_hours: int = Query(1, ge=1, le=168),
+    user_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_read_db)
+):
+    try:
+        payload = verify_token(credentials.credentials)
+        current_user_id = payload.get("sub")
+        if current_user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
 
-            team_info.append({
-                "role": member.role,
-                "user_id": member.user_id,
-                "name": user.name,
-                "avatar_url": user.avatar_url,
-                "specialties": specialties,
-                "orientations": orientations,
-                "core_time": user.core_time,
-                "biz": final_biz,
-                "design": final_design,
-                "tech": final_tech,
-            })
+        availability_index.ensure_loaded(db)
+        bitmap = availability_index.bitmap_of(user_id or current_user_id)
+        if bitmap is None:
+            raise HTTPException(status_code=404, detail="User not found")
 
-        return team_info
+        return {"data": availability_index.match_teams(bitmap, min_hours, limit=limit)}
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def _event_stream(request: Request, topic):
+    try:
+        subscription = team_events.subscribe(topic)
+    except SubscriptionLimitError:
+        raise HTTPException(status_code=503, detail="Too many subscribers", headers={"Retry-After": "5"})
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _format_sse(event)
+        finally:
+            team_events.unsubscribe(subscription)
+
+    # 送信が始まる前に切断された場合(ジェネレーターが開始されない)も購読を解除する
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(team_events.unsubscribe, subscription),
+    )
+
+# 全チームの変更イベント(Server-Sent Events)
+# /api/team/{team_id} より先に登録する必要がある
+@router.get("/api/team/events")
+async def stream_all_team_events(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
+):
+    verify_token(credentials.credentials)
+    return await _event_stream(request, ALL_TEAMS)
+
+# チーム単位の変更イベント(Server-Sent Events)
+@router.get("/api/team/{team_id}/events")
+async def stream_team_events(
+    team_id: int,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
+):
+    verify_token(credentials.credentials)
+    return await _event_stream(request, team_id)
+
+# チーム単位の変更イベント(WebSocket)
+# ブラウザのWebSocketはヘッダーを付けられないため、トークンはクエリで受け取る
+@router.websocket("/api/team/{team_id}/ws")
+async def team_events_websocket(websocket: WebSocket, team_id: int, token: str = Query(...)):
+    try:
+        verify_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    try:
+        subscription = team_events.subscribe(team_id)
+    except SubscriptionLimitError:
+        await websocket.close(code=1013)
+        return
+
+    await websocket.accept()
+
+    async def wait_disconnect():
+        # クライアントからのメッセージは使わないが、切断検知のため読み続ける
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    receiver = asyncio.create_task(wait_disconnect())
+    try:
+        while not receiver.done():
+            getter = asyncio.create_task(subscription.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                await websocket.send_json(getter.result())
+            else:
+                getter.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        team_events.unsubscribe(subscription)
+
+def _load_team_roster(db: Session, team_id: int):
+    return load_team_rosters(db, [team_id])[team_id]
+
+@router.get("/api/team/{team_id}")
+def get_team_info(
+    team_id: int,
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
+):
+    try:
+        payload = verify_token(credentials.credentials)
+
+        # メンバーの追加・削除、メンバーのテスト結果登録で無効化される。
+        # メンバー行の更新時刻はメンバーの削除やスキルの変化では変わらないため Last-Modified は付けず、
+        # 304の判定はETag(レスポンス内容のハッシュ)のみで行う
+        return cache.get_or_load(
+            f"team:members:{team_id}", lambda: run_on_primary(_load_team_roster, team_id), tags=[f"team:{team_id}"]
+        )
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# チームのスキル合計・平均・バランス
+# バックグラウンドで計算済みのスナップショットを返し、古い・未計算の場合はその場で計算する
+@router.get("/api/team/{team_id}/summary")
+def get_team_summary(
+    team_id: int,
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_read_db)
+):
+    try:
+        payload = verify_token(credentials.credentials)
+
+        snapshot = precompute.fresh_team_snapshot(db, team_id)
+        if snapshot is not None:
+            summary = {
+                "member_count": snapshot.member_count,
+                "biz_total": snapshot.biz_total,
+                "design_total": snapshot.design_total,
+                "tech_total": snapshot.tech_total,
+                "balance": snapshot.balance,
+            }
+            computed_at, source = snapshot.computed_at, "snapshot"
+        else:
+            if db.query(Team.id).filter(Team.id == team_id).first() is None:
+                raise HTTPException(status_code=404, detail="Team not found")
+            summary = compute_team_summaries(db, [team_id])[team_id]
+            computed_at, source = datetime.utcnow(), "live"
+            # 次回からスナップショットを使えるようにする
+            precompute.mark_team_dirty(team_id)
+
+        count = summary["member_count"]
+        return {
+            "team_id": team_id,
+            "member_count": count,
+            "totals": {key: summary[f"{key}_total"] for key in SKILL_KEYS},
+            "averages": {key: round(summary[f"{key}_total"] / count, 2) if count else 0 for key in SKILL_KEYS},
+            "balance": summary["balance"],
+            "computed_at": computed_at.isoformat(),
+            "source": source,
+        }
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -147,6 +410,9 @@ def create_team(
         db.commit()
         db.refresh(new_team)
 
+        precompute.mark_team_dirty(new_team.id)
+        team_events.publish("team_created", new_team.id, name=new_team.name)
+
         # 作成者をPdMなど特定のロールで初期アサインするなどの対応も可能だが、ここでは空チームを返すだけ
         return {"team_id": new_team.id, "team_name": new_team.name}
     except JWTError:
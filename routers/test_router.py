@@ -3,9 +3,13 @@ from fastapi import APIRouter, Depends, HTTPException, Security
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import Optional
-from db.database import get_db
-from db.models import TestResult, UserMaster, Specialty
+from db.database import get_db, get_read_db
+from db.models import TestResult, UserMaster, Specialty, TeamMember
 from utils.security import verify_token
+from utils.skills import GROWTH_PER_CORRECT
+from utils.leaderboard import leaderboard
+from utils.cache import cache
+from utils.precompute import precompute, expire_snapshots
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import logging
 from sqlalchemy import desc
@@ -16,6 +20,9 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 bearer_scheme = HTTPBearer()
 
+# カテゴリ一覧のキャッシュ保持時間(秒)
+SPECIALTY_CACHE_TTL = 600
+
 class TestResultCreate(BaseModel):
     category: str = Field(..., example="Tech")
     correct_answers: int = Field(..., example=2)
@@ -31,6 +38,12 @@ class TestResultOut(BaseModel):
         from_attributes = True  # 'orm_mode' を 'from_attributes' に変更
 
 
+def _load_categories(db: Session):
+    return [s.specialty for s in db.query(Specialty.specialty).all()]
+
+def _load_test_results(db: Session, user_id: str):
+    return db.query(TestResult).filter(TestResult.user_id == user_id).order_by(desc(TestResult.created_at)).all()
+
 @router.post("/api/test_results/", response_model=TestResultOut, status_code=201)
 def create_test_result(
     test_result: TestResultCreate,
@@ -44,8 +57,14 @@ def create_test_result(
             raise HTTPException(status_code=401, detail="Invalid token")
 
         # カテゴリの存在確認
-        category = db.query(Specialty).filter(Specialty.specialty == test_result.category).first()
-        if not category:
+        categories = cache.get_or_load(
+            "specialties",
+            lambda: _load_categories(db),
+            ttl=SPECIALTY_CACHE_TTL,
+            tags=["specialties"],
+        )
+        # MySQLの照合順序と同じく大文字・小文字を区別しない
+        if test_result.category.lower() not in {category.lower() for category in categories}:
             raise HTTPException(status_code=400, detail="Invalid category")
 
         # テスト結果の作成
@@ -55,9 +74,20 @@ def create_test_result(
             correct_answers=test_result.correct_answers
         )
         db.add(new_test_result)
+        # スキル値が変わるので、本人と所属チームのスナップショットを全ワーカーで無効にする
+        team_ids = [m.team_id for m in db.query(TeamMember.team_id).filter(TeamMember.user_id == user_id).all()]
+        expire_snapshots(db, user_ids=[user_id], team_ids=team_ids)
         db.commit()
         db.refresh(new_test_result)
 
+        # リーダーボードに成長分を反映
+        leaderboard.add_growth(user_id, new_test_result.category, new_test_result.correct_answers * GROWTH_PER_CORRECT)
+
+        # スナップショットを再計算対象にし、本人と所属チームのキャッシュを無効化
+        precompute.mark_user_dirty(user_id)
+        precompute.mark_team_dirty(*team_ids)
+        cache.invalidate_tags(f"user:{user_id}", *(f"team:{team_id}" for team_id in team_ids))
+
         return new_test_result
 
     except HTTPException as he:
@@ -69,7 +99,7 @@ def create_test_result(
 @router.get("/api/test_results/", response_model=List[TestResultOut])
 def get_user_test_results(
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     try:
         payload = verify_token(credentials.credentials)
@@ -77,8 +107,7 @@ def get_user_test_results(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        test_results = db.query(TestResult).filter(TestResult.user_id == user_id).order_by(desc(TestResult.created_at)).all()
-        return test_results
+        return _load_test_results(db, user_id)
 
     except HTTPException as he:
         raise he
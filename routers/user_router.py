@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, status, Security, Query
+from fastapi import APIRouter, Depends, HTTPException, Header, status, Security, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from db.database import get_db
-from db.models import UserMaster, StatusTable, Specialty, Orientation, TeamMember, TestResult
+from db.database import get_read_db, run_on_primary
+from db.models import UserMaster, StatusTable, Specialty, Orientation, TeamMember, TestResult, Quiz
 from utils.security import verify_token
+from utils.skills import GROWTH_PER_CORRECT, SKILL_KEYS, load_base_status, load_growth
+from routers.team_router import load_team_rosters
+from utils.availability import availability_index, to_hex
+from utils.cache import cache
+from utils.precompute import precompute
 from jose import JWTError
 from pydantic import BaseModel
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import logging
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy import func
 from datetime import datetime
+import time
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -26,8 +32,7 @@ class UserFilter(BaseModel):
 
 @router.get("/api/user/me")
 def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(get_db)
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
 ):
     try:
         payload = verify_token(credentials.credentials)
@@ -35,23 +40,11 @@ def get_current_user(
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        user = db.query(UserMaster).filter(UserMaster.user_id == user_id).first()
-        if user is None:
+        # 所属チームIDも含めて返す
+        profile = _cached_profile(user_id)
+        if profile is None:
             raise HTTPException(status_code=404, detail="User not found")
-
-        # 所属チームIDを取得する処理を追加
-        member_record = db.query(TeamMember).filter(TeamMember.user_id == user_id).first()
-        team_id = member_record.team_id if member_record else None
-
-        return {
-            "user_id": user.user_id,
-            "name": user.name,
-            "avatar_url": user.avatar_url,
-            "core_time": user.core_time,
-            "specialties": [s.specialty for s in user.specialties],
-            "orientations": [o.orientation for o in user.orientations],
-            "team_id": team_id  # チームIDを返す
-        }
+        return profile
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     except Exception as e:
@@ -60,8 +53,7 @@ def get_current_user(
 @router.get("/api/user/skills")
 def get_user_skills(
     date: Optional[str] = Query(None),
-    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(get_db)
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
 ):
     try:
         payload = verify_token(credentials.credentials)
@@ -69,61 +61,79 @@ def get_user_skills(
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-        user = db.query(UserMaster).filter(UserMaster.user_id == user_id).first()
-        if user is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-        status_rec = db.query(StatusTable).filter(StatusTable.user_id == user_id).first()
-        if status_rec is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User skills not found")
-
-        # dateが指定されていたらその日までのtest_resultsを集計
-        query = db.query(
-            TestResult.category,
-            func.sum(TestResult.correct_answers).label("total_correct")
-        ).filter(TestResult.user_id == user_id)
-
-        if date:
-            try:
-                cutoff = datetime.strptime(date, "%Y-%m-%d")
-                query = query.filter(TestResult.created_at <= cutoff)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-
-        growth = query.group_by(TestResult.category).all()
-
-        growth_dict = {}
-        for record in growth:
-            # 1正解につき +2 の成長例
-            growth_value = record.total_correct * 2
-            growth_dict[record.category.lower()] = growth_value
-
-        skills = {
-            "biz": status_rec.biz + growth_dict.get("biz", 0),
-            "design": status_rec.design + growth_dict.get("design", 0),
-            "tech": status_rec.tech + growth_dict.get("tech", 0),
-        }
-
-        skill_data = {
-            "name": user.name,
-            "biz": skills["biz"],
-            "design": skills["design"],
-            "tech": skills["tech"]
-        }
-
-        return skill_data
+        # 日付指定ごとにキャッシュする。テスト結果の登録で無効化される
+        return cache.get_or_load(
+            f"user:skills:{user_id}:{date or 'latest'}",
+            lambda: run_on_primary(_load_skill_data, user_id, date),
+            tags=[f"user:{user_id}"],
+        )
 
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Unhandled error in get_user_skills: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+def _load_skill_data(db: Session, user_id: str, date: Optional[str]):
+    if date is None:
+        # 現在のスキルはバックグラウンドで計算済みのスナップショットを優先する
+        snapshot = precompute.fresh_user_snapshots(db, [user_id]).get(user_id)
+        if snapshot is not None and snapshot.has_status:
+            name = db.query(UserMaster.name).filter(UserMaster.user_id == user_id).scalar()
+            if name is not None:
+                return {"name": name, "biz": snapshot.biz, "design": snapshot.design, "tech": snapshot.tech}
+
+    user = db.query(UserMaster).filter(UserMaster.user_id == user_id).first()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    status_rec = db.query(StatusTable).filter(StatusTable.user_id == user_id).first()
+    if status_rec is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User skills not found")
+
+    # dateが指定されていたらその日までのtest_resultsを集計
+    query = db.query(
+        TestResult.category,
+        func.sum(TestResult.correct_answers).label("total_correct")
+    ).filter(TestResult.user_id == user_id)
+
+    if date:
+        try:
+            cutoff = datetime.strptime(date, "%Y-%m-%d")
+            query = query.filter(TestResult.created_at <= cutoff)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+
+    growth = query.group_by(TestResult.category).all()
+
+    growth_dict = {}
+    for record in growth:
+        # 1正解につき +2 の成長例
+        growth_value = record.total_correct * GROWTH_PER_CORRECT
+        growth_dict[record.category.lower()] = growth_value
+
+    skills = {
+        "biz": status_rec.biz + growth_dict.get("biz", 0),
+        "design": status_rec.design + growth_dict.get("design", 0),
+        "tech": status_rec.tech + growth_dict.get("tech", 0),
+    }
+
+    skill_data = {
+        "name": user.name,
+        "biz": skills["biz"],
+        "design": skills["design"],
+        "tech": skills["tech"]
+    }
+
+    return skill_data
     
 @router.post("/api/user/search")
 def search_users(
     filters: UserFilter,
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     try:
         payload = verify_token(credentials.credentials)
@@ -172,7 +182,7 @@ def search_users(
 @router.get("/api/user/orientation")
 def get_user_orientations(
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     try:
         # トークンからユーザーIDを取得
@@ -199,3 +209,165 @@ def get_user_orientations(
         logger.error(f"Unhandled error in get_user_orientations: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+# ダッシュボード初期表示用にまとめて返す項目
+BOOTSTRAP_FIELDS = ("profile", "skills", "orientations", "team", "quiz_dates")
+# 返すクイズ日付の件数(新しい順)
+BOOTSTRAP_QUIZ_DATES = 7
+
+def _load_profile(db: Session, user_id: str):
+    user = db.query(UserMaster).options(
+        selectinload(UserMaster.specialties),
+        selectinload(UserMaster.orientations)
+    ).filter(UserMaster.user_id == user_id).first()
+    if user is None:
+        return None
+    member_record = db.query(TeamMember).filter(TeamMember.user_id == user_id).first()
+    return {
+        "user_id": user.user_id,
+        "name": user.name,
+        "avatar_url": user.avatar_url,
+        "core_time": user.core_time,
+        "specialties": [s.specialty for s in user.specialties],
+        "orientations": [o.orientation for o in user.orientations],
+        "team_id": member_record.team_id if member_record else None,
+    }
+
+def _cached_profile(user_id: str):
+    # チームへの追加・削除で無効化される。共有するのでキャッシュにない場合はプライマリから読む
+    return cache.get_or_load(
+        f"user:profile:{user_id}", lambda: run_on_primary(_load_profile, user_id), tags=[f"user:{user_id}"]
+    )
+
+def _load_current_skills(db: Session, user_id: str):
+    # /api/user/skills と同じく、ステータスがない場合はスキルなし
+    snapshot = precompute.fresh_user_snapshots(db, [user_id]).get(user_id)
+    if snapshot is not None:
+        return {key: getattr(snapshot, key) for key in SKILL_KEYS} if snapshot.has_status else None
+    base = load_base_status(db, [user_id]).get(user_id)
+    if base is None:
+        return None
+    growth = load_growth(db, [user_id]).get(user_id, {})
+    return {key: base[key] + growth.get(key, 0) for key in SKILL_KEYS}
+
+def _load_team(db: Session, user_id: str):
+    member_record = db.query(TeamMember).filter(TeamMember.user_id == user_id).first()
+    if member_record is None:
+        return None
+    return {
+        "team_id": member_record.team_id,
+        "members": load_team_rosters(db, [member_record.team_id])[member_record.team_id],
+    }
+
+def _load_quiz_dates(db: Session):
+    dates = db.query(Quiz.date).distinct().order_by(Quiz.date.desc()).limit(BOOTSTRAP_QUIZ_DATES).all()
+    return [d[0].isoformat() for d in dates]
+
+@router.get("/api/user/bootstrap")
+def get_bootstrap(
+    response: Response,
+    fields: Optional[str] = Query(None),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_read_db)
+):
+    """
+    ログイン直後に必要な情報(プロフィール・スキル・志向・チーム・最新のクイズ日付)を1回で返す。
+    fields にカンマ区切りで項目を指定すると、その項目だけを返す。
+    """
+    try:
+        started = time.perf_counter()
+        payload = verify_token(credentials.credentials)
+        user_id = payload.get("sub")
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(BOOTSTRAP_FIELDS)
+        unknown = [f for f in requested if f not in BOOTSTRAP_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+        timings = {}
+
+        def run(name, loader, *args):
+            # どのクエリもインデックスで数ms以内に終わるため、並行させずに1つのセッションで順に実行する
+            # (並行させるとセッションと接続を項目の数だけ使う)。
+            # プロフィールだけは共有キャッシュに入れるため、キャッシュにない場合はプライマリの別セッションで読む
+            branch_started = time.perf_counter()
+            try:
+                return loader(*args)
+            finally:
+                timings[name] = (time.perf_counter() - branch_started) * 1000
+
+        need_profile = "profile" in requested or "orientations" in requested
+        results = {}
+        if need_profile:
+            results["profile"] = run("profile", _cached_profile, user_id)
+        if "skills" in requested:
+            results["skills"] = run("skills", _load_current_skills, db, user_id)
+        if "team" in requested:
+            results["team"] = run("team", _load_team, db, user_id)
+        if "quiz_dates" in requested:
+            results["quiz_dates"] = run("quiz_dates", _load_quiz_dates, db)
+
+        if need_profile and results["profile"] is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        data = {}
+        if "profile" in requested:
+            data["profile"] = results["profile"]
+        if "orientations" in requested:
+            data["orientations"] = results["profile"]["orientations"]
+        if "skills" in requested:
+            data["skills"] = results["skills"]
+        if "team" in requested:
+            data["team"] = results["team"]
+        if "quiz_dates" in requested:
+            data["quiz_dates"] = results["quiz_dates"]
+
+        # 各処理の所要時間(従来の4回呼び出しとの比較は benchmarks/bootstrap.py)
+        timings["total"] = (time.perf_counter() - started) * 1000
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={dur:.1f}" for name, dur in timings.items())
+
+        return data
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in get_bootstrap: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+# コアタイムが min_hours 時間以上重なるユーザーを検索
+@router.get("/api/user/availability/match")
+def match_user_availability(
+    min_hours: int = Query(1, ge=1, le=168),
+    user_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
+    db: Session = Depends(get_read_db)
+):
+    try:
+        payload = verify_token(credentials.credentials)
+        current_user_id = payload.get("sub")
+        if current_user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        # user_id未指定の場合は自分のコアタイムを基準にする
+        target_user_id = user_id or current_user_id
+        availability_index.ensure_loaded(db)
+        bitmap = availability_index.bitmap_of(target_user_id)
+        if bitmap is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        return {
+            "user_id": target_user_id,
+            "availability": to_hex(bitmap),
+            "available_hours": bin(bitmap).count("1"),
+            "data": availability_index.match_users(bitmap, min_hours, exclude=target_user_id, limit=limit),
+        }
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Unhandled error in match_user_availability: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
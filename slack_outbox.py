@@ -0,0 +1,295 @@
+"""
+Slack送信の永続アウトボックス。
+
+APIエンドポイントは送信内容をSQLiteに積んですぐに job_id を返し、
+バックグラウンドのディスパッチャーがSlackのレート制限を守りながら送信する。
+同じメッセージへの同じリアクションはまとめて1回だけ送る。
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from dotenv import load_dotenv
+
+from slack_utils import call_slack_api, CHANNEL_ID
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = os.getenv("SLACK_OUTBOX_PATH", "database/slack_outbox.db")
+MAX_ATTEMPTS = int(os.getenv("SLACK_OUTBOX_MAX_ATTEMPTS", "5"))
+POLL_INTERVAL = 0.5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+# 送信中のジョブの占有期限(秒)。これを過ぎたジョブは送信中に停止したとみなして再送する
+# (Slack APIのタイムアウト10秒より十分長くする)
+SENDING_LEASE_SECONDS = 120.0
+
+# 同じチャンネルへの送信間隔(秒)。chat.postMessageはチャンネルごとに約1件/秒
+CHANNEL_INTERVALS = {"chat.postMessage": 1.0}
+# メソッド全体での送信間隔(秒)。reactions.addはTier 3(約50件/分)
+METHOD_INTERVALS = {"reactions.add": 1.2}
+
+# 再送しても成功しないエラー以外は再送する
+RETRYABLE_ERRORS = {"ratelimited", "internal_error", "fatal_error", "service_unavailable", "request_timeout"}
+# 成功とみなすエラー
+IGNORABLE_ERRORS = {"already_reacted"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slack_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    method TEXT NOT NULL,
+    channel TEXT,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_slack_jobs_due ON slack_jobs (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS ix_slack_jobs_dedupe ON slack_jobs (dedupe_key);
+CREATE TABLE IF NOT EXISTS slack_rate_limits (
+    key TEXT PRIMARY KEY,
+    next_allowed_at REAL NOT NULL
+);
+"""
+
+
+def _rate_keys(method, channel):
+    keys = [(f"method:{method}", METHOD_INTERVALS.get(method, 0))]
+    if method in CHANNEL_INTERVALS and channel:
+        keys.append((f"channel:{method}:{channel}", CHANNEL_INTERVALS[method]))
+    return keys
+
+
+class SlackOutbox:
+    """SQLiteに保存する送信キュー。複数ワーカーから同じファイルを使っても二重送信しない"""
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        conn = self._open()
+        try:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(slack_jobs)")}
+            if "claimed_at" not in columns:
+                conn.execute("ALTER TABLE slack_jobs ADD COLUMN claimed_at REAL")
+                conn.execute("UPDATE slack_jobs SET claimed_at = updated_at WHERE status = 'sending'")
+        finally:
+            conn.close()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _connect(self):
+        return _Transaction(self._open())
+
+    def enqueue(self, method, channel, payload, dedupe_key=None):
+        now = time.time()
+        with self._connect() as conn:
+            if dedupe_key:
+                # まだ送っていない同じジョブにだけまとめる(送信済み・失敗済みなら新しく送る)
+                existing = conn.execute(
+                    "SELECT id FROM slack_jobs WHERE dedupe_key = ? AND status IN ('pending', 'sending')"
+                    " ORDER BY id DESC LIMIT 1",
+                    (dedupe_key,),
+                ).fetchone()
+                if existing:
+                    return existing["id"]
+            cursor = conn.execute(
+                "INSERT INTO slack_jobs (method, channel, payload, dedupe_key, status, next_attempt_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (method, channel, json.dumps(payload, ensure_ascii=False), dedupe_key, now, now, now),
+            )
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM slack_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "method": row["method"],
+            "channel": row["channel"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "last_error": row["last_error"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def claim_next(self):
+        """
+        レート制限内で送れる最も古いジョブを送信中にして返す。
+        送れるジョブがなければ (None, 次に送れるまでの秒数) を返す。
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # 占有期限切れの送信中ジョブ(送信中にワーカーが停止したもの)も対象にする。
+            # レート制限はメソッドとチャンネルで決まるため、その組ごとに最も古いジョブだけを候補にする
+            # (件数で区切ると、1つのチャンネルに溜まったジョブが他のチャンネルの送信を止めてしまう)
+            due = conn.execute(
+                "SELECT * FROM slack_jobs WHERE id IN ("
+                " SELECT MIN(id) FROM slack_jobs WHERE (status = 'pending' AND next_attempt_at <= ?)"
+                " OR (status = 'sending' AND claimed_at <= ?) GROUP BY method, channel"
+                ") ORDER BY id",
+                (now, now - SENDING_LEASE_SECONDS),
+            ).fetchall()
+            limits = {row["key"]: row["next_allowed_at"] for row in conn.execute("SELECT * FROM slack_rate_limits")}
+
+            wait = None
+            for job in due:
+                keys = _rate_keys(job["method"], job["channel"])
+                blocked_until = max((limits.get(key, 0) for key, _ in keys), default=0)
+                if blocked_until > now:
+                    wait = blocked_until - now if wait is None else min(wait, blocked_until - now)
+                    continue
+                for key, interval in keys:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO slack_rate_limits (key, next_allowed_at) VALUES (?, ?)",
+                        (key, now + interval),
+                    )
+                conn.execute(
+                    "UPDATE slack_jobs SET status = 'sending', attempts = attempts + 1, claimed_at = ?, updated_at = ? WHERE id = ?",
+                    (now, now, job["id"]),
+                )
+                return dict(job, attempts=job["attempts"] + 1), None
+            return None, wait
+
+    def mark_sent(self, job_id, result):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE slack_jobs SET status = 'sent', result = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), now, job_id),
+            )
+
+    def mark_retry(self, job_id, error, delay, count_attempt=True):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE slack_jobs SET status = 'pending', last_error = ?, next_attempt_at = ?, updated_at = ?,"
+                " attempts = attempts - ? WHERE id = ?",
+                (error, now + delay, now, 0 if count_attempt else 1, job_id),
+            )
+
+    def mark_failed(self, job_id, error, result=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE slack_jobs SET status = 'failed', last_error = ?, result = ?, updated_at = ? WHERE id = ?",
+                (error, json.dumps(result, ensure_ascii=False) if result else None, now, job_id),
+            )
+
+    def block(self, method, channel, seconds):
+        """Slackから Retry-After を返されたときに送信を止める"""
+        until = time.time() + seconds
+        with self._connect() as conn:
+            for key, _ in _rate_keys(method, channel):
+                conn.execute(
+                    "INSERT OR REPLACE INTO slack_rate_limits (key, next_allowed_at) VALUES (?, ?)",
+                    (key, until),
+                )
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM slack_jobs GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE で書き込みロックを取って実行し、終了時にコミットして閉じる"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
+
+
+outbox = SlackOutbox()
+
+
+def enqueue_message(text):
+    return outbox.enqueue("chat.postMessage", CHANNEL_ID, {"channel": CHANNEL_ID, "text": text})
+
+
+def enqueue_reply(channel, thread_ts, text):
+    return outbox.enqueue("chat.postMessage", channel, {"channel": channel, "text": text, "thread_ts": thread_ts})
+
+
+def enqueue_reaction(channel, timestamp, emoji):
+    # 同じメッセージへの同じリアクションは1件にまとめる
+    return outbox.enqueue(
+        "reactions.add",
+        channel,
+        {"channel": channel, "name": emoji, "timestamp": timestamp},
+        dedupe_key=f"reactions.add:{channel}:{timestamp}:{emoji}",
+    )
+
+
+def _backoff(attempts):
+    return min(BACKOFF_BASE ** attempts, BACKOFF_MAX)
+
+
+async def dispatch_once():
+    """送れるジョブを1件送信する。送らなかった場合は次に試すまでの待ち秒数を返す"""
+    job, wait = await asyncio.to_thread(outbox.claim_next)
+    if job is None:
+        return min(wait, POLL_INTERVAL) if wait is not None else POLL_INTERVAL
+
+    payload = json.loads(job["payload"])
+    try:
+        result, retry_after = await asyncio.to_thread(call_slack_api, job["method"], payload)
+    except Exception as e:
+        result, retry_after = {"ok": False, "error": f"request_failed: {e}"}, None
+
+    error = result.get("error") or "unknown_error"
+    if result.get("ok") or error in IGNORABLE_ERRORS:
+        await asyncio.to_thread(outbox.mark_sent, job["id"], result)
+    elif error == "ratelimited":
+        delay = retry_after or _backoff(job["attempts"])
+        await asyncio.to_thread(outbox.block, job["method"], job["channel"], delay)
+        # レート制限による再送は試行回数に数えない
+        await asyncio.to_thread(outbox.mark_retry, job["id"], error, delay, False)
+    elif (error in RETRYABLE_ERRORS or error.startswith(("request_failed", "http_5"))) and job["attempts"] < MAX_ATTEMPTS:
+        await asyncio.to_thread(outbox.mark_retry, job["id"], error, _backoff(job["attempts"]))
+    else:
+        logger.error(f"Slack job {job['id']} failed: {error}")
+        await asyncio.to_thread(outbox.mark_failed, job["id"], error, result)
+    return 0
+
+
+async def run_dispatcher(stop_event: asyncio.Event):
+    """FastAPIのlifespanで起動するバックグラウンドディスパッチャー"""
+    while not stop_event.is_set():
+        try:
+            wait = await dispatch_once()
+        except Exception as e:
+            logger.error(f"Slack dispatcher error: {e}")
+            wait = POLL_INTERVAL
+        if wait:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
@@ -69,3 +69,18 @@ def reply_to_message(channel, thread_ts, text):
     data = {"channel": channel, "text": text, "thread_ts": thread_ts}
     response = requests.post(url, headers=HEADERS, json=data)
     return response.json()
+
+def call_slack_api(method, data):
+    """Slack Web APIを呼び出し、(レスポンスJSON, Retry-After秒)を返す"""
+    url = f"https://slack.com/api/{method}"
+    response = requests.post(url, headers=HEADERS, json=data, timeout=10)
+    retry_after = None
+    if response.status_code == 429:
+        retry_after = float(response.headers.get("Retry-After", "1"))
+    try:
+        body = response.json()
+    except ValueError:
+        body = {"ok": False, "error": f"http_{response.status_code}"}
+    if response.status_code == 429 and body.get("ok") is not False:
+        body = {"ok": False, "error": "ratelimited"}
+    return body, retry_after
@@ -0,0 +1,7 @@
+import os
+import sys
+from pathlib import Path
+
+# MySQLの接続設定がなくてもアプリのモジュールを読み込めるようにする
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,82 @@
+"""
+コアタイムの解釈を、実際のデータ(database/team_building.db の Availability など)の書き方で確認する。
+
+    python -m pytest tests
+"""
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from utils.availability import DAYS_PER_WEEK, HOURS_PER_DAY, parse_core_time
+
+WEEKDAYS = [0, 1, 2, 3, 4]
+WEEKENDS = [5, 6]
+EVERY_DAY = list(range(DAYS_PER_WEEK))
+
+
+def hours_by_day(bitmap: int) -> list:
+    return [
+        [hour for hour in range(HOURS_PER_DAY) if bitmap >> (day * HOURS_PER_DAY + hour) & 1]
+        for day in range(DAYS_PER_WEEK)
+    ]
+
+
+def expected(days, hours) -> list:
+    return [list(hours) if day in days else [] for day in range(DAYS_PER_WEEK)]
+
+
+# (コアタイム, 曜日, 時間帯)
+CASES = [
+    # database/team_building.db の UserSkills.Availability
+    ("22時以降", EVERY_DAY, range(22, 24)),
+    ("21時以降", EVERY_DAY, range(21, 24)),
+    ("20時以降", EVERY_DAY, range(20, 24)),
+    # 曜日が前
+    ("平日 19:00-22:00", WEEKDAYS, range(19, 22)),
+    ("土日10時〜18時", WEEKENDS, range(10, 18)),
+    ("Mon-Fri 9-17", WEEKDAYS, range(9, 17)),
+    # 曜日が後
+    ("19:00-22:00 平日", WEEKDAYS, range(19, 22)),
+    ("9時-18時(平日)", WEEKDAYS, range(9, 18)),
+    # 時間帯の呼び方
+    ("平日夜", WEEKDAYS, range(18, 24)),
+    ("土日祝 終日", WEEKENDS, range(0, 24)),
+    ("19時から22時まで", EVERY_DAY, range(19, 22)),
+    ("午後7時以降", EVERY_DAY, range(19, 24)),
+    ("10時まで", EVERY_DAY, range(0, 10)),
+]
+
+
+@pytest.mark.parametrize("text, days, hours", CASES)
+def test_parse_core_time(text, days, hours):
+    assert hours_by_day(parse_core_time(text)) == expected(days, hours)
+
+
+def test_days_before_and_after_in_one_text():
+    by_day = hours_by_day(parse_core_time("19-22 平日 10-18 土日"))
+    assert by_day == [list(range(19, 22))] * 5 + [list(range(10, 18))] * 2
+
+
+def test_separated_segments():
+    by_day = hours_by_day(parse_core_time("月水金 20-23 / 土 9:30-12:00"))
+    assert by_day == [[20, 21, 22], [], [20, 21, 22], [], [20, 21, 22], [9, 10, 11], []]
+
+
+def test_late_night_wraps_to_next_day():
+    by_day = hours_by_day(parse_core_time("金 22-2"))
+    assert by_day[4] == [22, 23] and by_day[5] == [0, 1]
+
+
+@pytest.mark.parametrize("text", [None, "", "応相談", "未定"])
+def test_unparseable_is_empty(text):
+    assert parse_core_time(text) == 0
+
+
+def test_sample_database_values_are_parsed():
+    # サンプルデータの値はすべて解釈できること
+    path = Path(__file__).resolve().parents[1] / "database" / "team_building.db"
+    with sqlite3.connect(path) as conn:
+        values = [row[0] for row in conn.execute("SELECT DISTINCT Availability FROM UserSkills")]
+    assert values
+    assert [value for value in values if parse_core_time(value) == 0] == []
@@ -0,0 +1,71 @@
+"""
+ログインのレート制限を、リバースプロキシの後ろ(X-Forwarded-For 付き)で確認する。
+
+    python -m pytest tests
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import utils.rate_limit as rate_limit
+from utils.rate_limit import AdmissionControlMiddleware, KeyedRateLimiter
+
+# TestClient の接続元アドレス
+PROXY = "testclient"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(rate_limit, "login_limiter", KeyedRateLimiter(per_minute=1, burst=2))
+    app = FastAPI()
+
+    @app.post(rate_limit.LOGIN_PATH)
+    async def login(body: dict):
+        return {"user_id": body.get("user_id")}
+
+    app.add_middleware(AdmissionControlMiddleware, trusted_proxies=[PROXY])
+    return TestClient(app)
+
+
+def login(client, user_id, forwarded_for=None):
+    headers = {"X-Forwarded-For": forwarded_for} if forwarded_for else {}
+    return client.post(rate_limit.LOGIN_PATH, json={"user_id": user_id, "password": "x"}, headers=headers)
+
+
+def test_body_reaches_handler(client):
+    response = login(client, "alice", "203.0.113.1")
+    assert response.status_code == 200
+    assert response.json() == {"user_id": "alice"}
+
+
+def test_limit_per_ip_and_user(client):
+    assert [login(client, "alice", "203.0.113.1").status_code for _ in range(3)] == [200, 200, 429]
+    # 同じIP(教室のNATなど)でも別のユーザーは制限されない
+    assert login(client, "bob", "203.0.113.1").status_code == 200
+    # 別のIPからの同じユーザーも別の枠
+    assert login(client, "alice", "203.0.113.2").status_code == 200
+
+
+def test_clients_behind_proxy_do_not_share_bucket(client):
+    for i in range(5):
+        assert login(client, "alice", f"203.0.113.{i}").status_code == 200
+
+
+def test_spoofed_forwarded_for_is_ignored(client):
+    # クライアントが付けた左側の値は使わず、プロキシが追加した右端の値で数える
+    statuses = [login(client, "alice", f"10.0.0.{i}, 203.0.113.1").status_code for i in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_forwarded_for_from_untrusted_peer_is_ignored(monkeypatch):
+    monkeypatch.setattr(rate_limit, "login_limiter", KeyedRateLimiter(per_minute=1, burst=1))
+    app = FastAPI()
+
+    @app.post(rate_limit.LOGIN_PATH)
+    async def login_route(body: dict):
+        return {}
+
+    app.add_middleware(AdmissionControlMiddleware, trusted_proxies=[])
+    untrusted = TestClient(app)
+    assert login(untrusted, "alice", "203.0.113.1").status_code == 200
+    assert login(untrusted, "alice", "203.0.113.2").status_code == 429
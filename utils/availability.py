@@ -0,0 +1,337 @@
+"""
+コアタイム(自由記述)を週単位の空き時間ビットマップに変換し、重なりを検索する。
+
+ビットマップは 1時間 = 1ビット、月曜0時をビット0とした 7 * 24 = 168 ビット。
+DBには16進文字列(UserMaster.core_time_bitmap)で保存する。
+"""
+import re
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db.models import UserMaster, TeamMember
+
+HOURS_PER_DAY = 24
+DAYS_PER_WEEK = 7
+HOURS_PER_WEEK = HOURS_PER_DAY * DAYS_PER_WEEK
+BITMAP_HEX_LENGTH = HOURS_PER_WEEK // 4
+WORDS = 3  # 168ビットを64ビット整数3つで保持する
+
+# インデックスを作り直す間隔(秒)
+INDEX_TTL = 300
+
+_DAY_GROUPS = {
+    "平日": [0, 1, 2, 3, 4],
+    "weekdays": [0, 1, 2, 3, 4],
+    "weekday": [0, 1, 2, 3, 4],
+    "土日": [5, 6],
+    "週末": [5, 6],
+    "土日祝": [5, 6],
+    "weekends": [5, 6],
+    "weekend": [5, 6],
+    "毎日": list(range(7)),
+    "全日": list(range(7)),
+    "daily": list(range(7)),
+    "everyday": list(range(7)),
+}
+_DAY_NAMES = {
+    "月": 0, "火": 1, "水": 2, "木": 3, "金": 4, "土": 5, "日": 6,
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+# 時刻の代わりに使われる時間帯の呼び方 (開始時, 終了時)
+_PERIODS = {
+    "終日": (0, 24),
+    "一日中": (0, 24),
+    "朝": (6, 9),
+    "午前": (9, 12),
+    "午後": (12, 18),
+    "夜間": (18, 24),
+    "夜": (18, 24),
+    "深夜": (22, 26),
+}
+
+_GROUP_PATTERN = "|".join(sorted((re.escape(k) for k in _DAY_GROUPS), key=len, reverse=True))
+_PERIOD_PATTERN = "|".join(sorted((re.escape(k) for k in _PERIODS), key=len, reverse=True))
+_DAY_PATTERN = r"(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?|[月火水木金土日](?:曜日?)?"
+_DASH = r"\s*(?:[-~〜～ー－]|から)\s*"
+_CLOCK = r"\d{1,2}(?:[:：]\d{2})?\s*時?"
+
+_TOKEN = re.compile(
+    rf"(?P<group>{_GROUP_PATTERN})"
+    rf"|(?P<range_days>(?:{_DAY_PATTERN}){_DASH}(?:{_DAY_PATTERN}))"
+    rf"|(?P<time>(?P<start>\d{{1,2}})(?:[:：](?P<start_min>\d{{2}}))?\s*時?{_DASH}(?P<end>\d{{1,2}})(?:[:：](?P<end_min>\d{{2}}))?\s*時?(?:まで)?)"
+    rf"|(?P<after>\d{{1,2}})(?:[:：]\d{{2}})?\s*時?\s*(?:以降|以後|から|[~〜～])"
+    rf"|(?P<before>\d{{1,2}})(?:[:：](?P<before_min>\d{{2}}))?\s*時?\s*(?:以前|まで)"
+    rf"|(?P<period>{_PERIOD_PATTERN})"
+    rf"|(?P<day>{_DAY_PATTERN})",
+    re.IGNORECASE,
+)
+# 区切り(区切りをまたいで曜日と時間帯は結び付けない)
+_SEPARATOR = re.compile(r"[、,，/／;；|\n]")
+# 「午後7時」は19時、「午前9時」は9時として読む
+_PM = re.compile(r"午後\s*(\d{1,2})\s*時?")
+_AM = re.compile(r"午前\s*(\d{1,2})\s*時?")
+
+
+def _day_index(token: str) -> int:
+    token = token.lower()
+    return _DAY_NAMES[token[:3] if token[0].isascii() else token[0]]
+
+
+def _days_in_range(token: str) -> list:
+    first, last = re.split(_DASH, token, maxsplit=1)
+    start, end = _day_index(first), _day_index(last)
+    return [(start + i) % DAYS_PER_WEEK for i in range((end - start) % DAYS_PER_WEEK + 1)]
+
+
+def _hours(start: int, end: int, end_min: str = None) -> list:
+    # 分の指定は、少しでも含まれる1時間枠を空きとみなす
+    if end_min and int(end_min) > 0:
+        end += 1
+    if start > 24 or end > 26:
+        return []
+    start %= HOURS_PER_DAY
+    length = (end - start) % HOURS_PER_DAY or (HOURS_PER_DAY if end != start else 0)
+    # 日をまたぐ時間帯は翌日側にも空きを入れる(start + i が24以上になる)
+    return [start + i for i in range(length)]
+
+
+def _token_hours(match) -> list:
+    if match.group("time"):
+        return _hours(int(match.group("start")), int(match.group("end")), match.group("end_min"))
+    if match.group("after"):
+        # 「N時以降」はその日の終わりまで
+        return _hours(int(match.group("after")), HOURS_PER_DAY)
+    if match.group("before"):
+        # 「N時以前」はその日の始まりから
+        return _hours(0, int(match.group("before")), match.group("before_min"))
+    return _hours(*_PERIODS[match.group("period")])
+
+
+def _token_days(match) -> list:
+    if match.group("group"):
+        return _DAY_GROUPS[match.group("group").lower()]
+    if match.group("range_days"):
+        return _days_in_range(match.group("range_days"))
+    if match.group("day"):
+        return [_day_index(match.group("day"))]
+    return None
+
+
+def parse_core_time(text) -> int:
+    """
+    コアタイムの文字列をビットマップに変換する。
+    例: "平日 19:00-22:00", "土日10時〜18時", "月水金 20-23 / 土 9:30-12:00", "Mon-Fri 9-17",
+        "22時以降", "19:00-22:00 平日", "9時-18時(平日)", "平日夜", "土日祝 終日"
+    曜日は前後どちらに書かれていても、区切り(、/ など)の中で隣接する時間帯に適用する。
+    曜日の指定がない時間帯は毎日とみなす。解釈できない場合は0。
+    """
+    if not text:
+        return 0
+    text = _AM.sub(r"\1時", _PM.sub(lambda m: f"{int(m.group(1)) % 12 + 12}時", text))
+
+    bitmap = 0
+
+    def apply(days, hours):
+        nonlocal bitmap
+        for day in (days or range(DAYS_PER_WEEK)):
+            for hour in hours:
+                bitmap |= 1 << ((day * HOURS_PER_DAY + hour) % HOURS_PER_WEEK)
+
+    days = []
+    for segment in _SEPARATOR.split(text):
+        # pending: 曜日より前に書かれた時間帯(「19-22 平日」)
+        pending = []
+        days_after = False
+        found_time = False
+        for match in _TOKEN.finditer(segment):
+            token_days = _token_days(match)
+            if token_days is not None:
+                days += token_days
+                continue
+            found_time = True
+            hours = _token_hours(match)
+            if pending and days:
+                # 「時間帯 曜日」の並び。直前の曜日は前の時間帯のもの
+                for pending_hours in pending:
+                    apply(days, pending_hours)
+                pending, days, days_after = [], [], True
+            if days and not days_after:
+                apply(days, hours)
+                days = []
+            else:
+                pending.append(hours)
+        for pending_hours in pending:
+            apply(days, pending_hours)
+        # 「月、水 20-22」のように曜日だけの区切りは次の区切りに引き継ぐ
+        if found_time:
+            days = []
+    return bitmap
+
+
+def to_hex(bitmap: int) -> str:
+    return format(bitmap, f"0{BITMAP_HEX_LENGTH}x")
+
+
+def from_hex(value) -> int:
+    return int(value, 16) if value else 0
+
+
+def _to_words(bitmap: int) -> list:
+    return [(bitmap >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in range(WORDS)]
+
+
+def user_bitmap(user: UserMaster) -> int:
+    # 保存済みのビットマップが空でコアタイムがある場合は、古い解釈で保存された可能性があるので読み直す
+    bitmap = from_hex(user.core_time_bitmap)
+    return bitmap or parse_core_time(user.core_time)
+
+
+class AvailabilityIndex:
+    """
+    全ユーザー(とチーム)の空き時間ビットマップをメモリ上の配列で保持する。
+    重なりの計算は AND と popcount を全行に対してまとめて行う。
+    """
+
+    def __init__(self, ttl: int = INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # 作り直しは1スレッドだけが行う
+        self._rebuild_lock = threading.Lock()
+        self._loaded_at = None
+        self._teams_stale = False
+        self.user_ids = []
+        self.names = []
+        self.user_words = np.zeros((0, WORDS), dtype=np.uint64)
+        self.team_ids = []
+        self.team_words = np.zeros((0, WORDS), dtype=np.uint64)
+        self._user_positions = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def invalidate_teams(self):
+        """メンバーの追加・削除ではユーザーのビットマップは変わらないので、チームだけを作り直す"""
+        with self._lock:
+            self._teams_stale = True
+
+    def _state(self) -> tuple:
+        with self._lock:
+            loaded = self._loaded_at is not None
+            users_fresh = loaded and time.monotonic() - self._loaded_at < self.ttl
+            return loaded, users_fresh, not self._teams_stale
+
+    def ensure_loaded(self, db: Session):
+        loaded, users_fresh, teams_fresh = self._state()
+        if users_fresh and teams_fresh:
+            return
+        # 読み込み済みなら、他のリクエストが作り直している間は古いインデックスを使う
+        if not self._rebuild_lock.acquire(blocking=not loaded):
+            return
+        try:
+            loaded, users_fresh, teams_fresh = self._state()
+            if not users_fresh:
+                self.rebuild(db)
+            elif not teams_fresh:
+                self.rebuild_teams(db)
+        finally:
+            self._rebuild_lock.release()
+
+    @staticmethod
+    def _team_words(db: Session, positions: dict, user_words: np.ndarray) -> tuple:
+        # チームの空き時間 = メンバー全員が空いている時間
+        members_by_team = {}
+        for member in db.query(TeamMember.team_id, TeamMember.user_id).all():
+            if member.user_id in positions:
+                members_by_team.setdefault(member.team_id, []).append(positions[member.user_id])
+        team_ids = sorted(members_by_team)
+        team_words = np.array(
+            [np.bitwise_and.reduce(user_words[members_by_team[t]], axis=0) for t in team_ids],
+            dtype=np.uint64,
+        ).reshape(len(team_ids), WORDS)
+        return team_ids, team_words
+
+    def rebuild(self, db: Session):
+        users = db.query(
+            UserMaster.user_id, UserMaster.name, UserMaster.core_time, UserMaster.core_time_bitmap
+        ).order_by(UserMaster.user_id).all()
+        user_ids = [u.user_id for u in users]
+        names = [u.name for u in users]
+        user_words = np.array(
+            [_to_words(user_bitmap(u)) for u in users], dtype=np.uint64
+        ).reshape(len(users), WORDS)
+        positions = {user_id: i for i, user_id in enumerate(user_ids)}
+        with self._lock:
+            self._teams_stale = False
+        team_ids, team_words = self._team_words(db, positions, user_words)
+
+        with self._lock:
+            self.user_ids = user_ids
+            self.names = names
+            self.user_words = user_words
+            self._user_positions = positions
+            self.team_ids = team_ids
+            self.team_words = team_words
+            self._loaded_at = time.monotonic()
+
+    def rebuild_teams(self, db: Session):
+        with self._lock:
+            positions, user_words = self._user_positions, self.user_words
+            # 作り直し中のメンバー変更は次回に反映する
+            self._teams_stale = False
+        team_ids, team_words = self._team_words(db, positions, user_words)
+        with self._lock:
+            self.team_ids = team_ids
+            self.team_words = team_words
+
+    def bitmap_of(self, user_id: str):
+        with self._lock:
+            position = self._user_positions.get(user_id)
+            if position is None:
+                return None
+            words = self.user_words[position]
+        return sum(int(word) << (64 * i) for i, word in enumerate(words))
+
+    @staticmethod
+    def _overlap_hours(words: np.ndarray, bitmap: int) -> np.ndarray:
+        query = np.array(_to_words(bitmap), dtype=np.uint64)
+        return np.bitwise_count(words & query).sum(axis=1, dtype=np.int64)
+
+    def match_users(self, bitmap: int, min_hours: int, exclude: str = None, limit: int = 50) -> list:
+        with self._lock:
+            user_ids, names, words = self.user_ids, self.names, self.user_words
+        hours = self._overlap_hours(words, bitmap)
+        candidates = np.nonzero(hours >= min_hours)[0]
+        # 重なりの多い順
+        order = candidates[np.argsort(-hours[candidates], kind="stable")]
+        result = []
+        for i in order:
+            if user_ids[i] == exclude:
+                continue
+            result.append({"user_id": user_ids[i], "name": names[i], "overlap_hours": int(hours[i])})
+            if len(result) >= limit:
+                break
+        return result
+
+    def match_teams(self, bitmap: int, min_hours: int, limit: int = 50) -> list:
+        with self._lock:
+            team_ids, words = self.team_ids, self.team_words
+        hours = self._overlap_hours(words, bitmap)
+        candidates = np.nonzero(hours >= min_hours)[0]
+        order = candidates[np.argsort(-hours[candidates], kind="stable")][:limit]
+        return [{"team_id": team_ids[i], "overlap_hours": int(hours[i])} for i in order]
+
+
+availability_index = AvailabilityIndex()
+
+
+@event.listens_for(UserMaster, "before_insert")
+@event.listens_for(UserMaster, "before_update")
+def _sync_core_time_bitmap(mapper, connection, target):
+    # core_timeを書き換えたらビットマップも合わせて更新する
+    target.core_time_bitmap = to_hex(parse_core_time(target.core_time))
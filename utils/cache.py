@@ -0,0 +1,238 @@
+"""
+差し替え可能なキャッシュ層。
+
+- MemoryBackend: プロセス内のLRU(TTL付き)。ワーカー間では共有されない
+- RedisBackend: Redis(互換サーバー)を使い、全ワーカーで値と無効化を共有する
+
+タグごとにバージョン番号を持ち、エントリには保存時のタグのバージョンを記録する。
+invalidate_tags でバージョンを進めると、そのタグを持つエントリはすべて無効になる。
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from db.config import CACHE_BACKEND, REDIS_URL, CACHE_DEFAULT_TTL, CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# 他ワーカーの読み込み完了を待つ最大時間(秒)
+LOCK_WAIT_SECONDS = 5.0
+LOCK_POLL_SECONDS = 0.05
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def tag_versions(self, tags) -> list:
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def acquire_lock(self, key: str, ttl: float) -> bool:
+        # プロセス内の重複読み込みは Cache 側のロックで防いでいる
+        return True
+
+    def release_lock(self, key: str):
+        pass
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class RedisBackend:
+    """値はJSONで保存する。redis-py互換のクライアント(fakeredisなど)を渡せる"""
+
+    def __init__(self, client, prefix: str = "cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return _MISSING if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: int):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False, default=str), ex=ttl)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def tag_versions(self, tags) -> list:
+        if not tags:
+            return []
+        values = self.client.mget([f"{self.prefix}tag:{tag}" for tag in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump_tags(self, tags):
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.incr(f"{self.prefix}tag:{tag}")
+        pipe.execute()
+
+    def acquire_lock(self, key: str, ttl: float) -> bool:
+        return bool(self.client.set(f"{self.prefix}lock:{key}", "1", nx=True, px=int(ttl * 1000)))
+
+    def release_lock(self, key: str):
+        self.client.delete(f"{self.prefix}lock:{key}")
+
+    def size(self) -> int:
+        return None
+
+
+class Cache:
+    def __init__(self, backend, default_ttl: int = CACHE_DEFAULT_TTL):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "loads": 0, "coalesced": 0, "invalidations": 0, "errors": 0}
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def _lookup(self, key: str, tags):
+        entry = self.backend.get(key)
+        if entry is _MISSING:
+            return _MISSING
+        if entry["tags"] != self.backend.tag_versions(tags):
+            self._count("stale")
+            return _MISSING
+        return entry["value"]
+
+    def _key_lock(self, key: str):
+        with self._key_locks_lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = [threading.Lock(), 0]
+            lock[1] += 1
+            return lock
+
+    def _release_key_lock(self, key: str, lock):
+        with self._key_locks_lock:
+            lock[1] -= 1
+            if lock[1] == 0:
+                self._key_locks.pop(key, None)
+
+    def get_or_load(self, key: str, loader, ttl: int = None, tags=()):
+        """
+        キャッシュにあれば返し、なければ loader() の結果を保存して返す。
+        同じキーの読み込みが同時に発生した場合は1回だけ loader を実行する。
+        """
+        tags = list(tags)
+        try:
+            value = self._lookup(key, tags)
+        except Exception as e:
+            # キャッシュ障害時はDBから読む
+            logger.error(f"Cache lookup failed for {key}: {e}")
+            self._count("errors")
+            return loader()
+        if value is not _MISSING:
+            self._count("hits")
+            return value
+        self._count("misses")
+
+        lock = self._key_lock(key)
+        try:
+            with lock[0]:
+                # 先行した読み込みが終わっていればその結果を使う
+                value = self._lookup(key, tags)
+                if value is not _MISSING:
+                    self._count("coalesced")
+                    return value
+                return self._load(key, loader, ttl or self.default_ttl, tags)
+        finally:
+            self._release_key_lock(key, lock)
+
+    def _load(self, key: str, loader, ttl: int, tags):
+        # 他ワーカーが読み込み中なら完了を待つ
+        locked = self.backend.acquire_lock(key, LOCK_WAIT_SECONDS)
+        if not locked:
+            deadline = time.monotonic() + LOCK_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_SECONDS)
+                value = self._lookup(key, tags)
+                if value is not _MISSING:
+                    self._count("coalesced")
+                    return value
+        try:
+            # 読み込み中に無効化された場合に古い値を残さないよう、読み込み前のバージョンを記録する
+            versions = self.backend.tag_versions(tags)
+            value = loader()
+            self._count("loads")
+            self.backend.set(key, {"value": value, "tags": versions}, ttl)
+            return value
+        finally:
+            if locked:
+                self.backend.release_lock(key)
+
+    def invalidate_tags(self, *tags):
+        if not tags:
+            return
+        try:
+            self.backend.bump_tags(tags)
+            self._count("invalidations", len(tags))
+        except Exception as e:
+            logger.error(f"Cache invalidation failed for {tags}: {e}")
+            self._count("errors")
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["backend"] = type(self.backend).__name__
+        stats["entries"] = self.backend.size()
+        return stats
+
+
+def create_cache() -> Cache:
+    if CACHE_BACKEND == "redis":
+        try:
+            import redis
+            return Cache(RedisBackend(redis.Redis.from_url(REDIS_URL)))
+        except ImportError:
+            logger.warning("redis is not installed; falling back to the in-process cache")
+    return Cache(MemoryBackend())
+
+
+cache = create_cache()
@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import re
+import threading
+import time
+
+from db.config import COMPRESSION_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # brotliが入っていない環境ではgzipのみ
+    brotli = None
+
+# ETag付与・304応答・圧縮の対象とするGETエンドポイント
+# (/api/analytics/skills はボディが数十MBになり、バッファリングと圧縮の方が重くなるため対象外)
+CACHEABLE_ROUTES = [
+    re.compile(r"^/api/user/(me|skills|orientation|bootstrap)$"),
+    re.compile(r"^/api/team/\d+$"),
+    re.compile(r"^/api/teams$"),
+    re.compile(r"^/get_all_dates$"),
+    re.compile(r"^/get_questions_by_date/[^/]+$"),
+    re.compile(r"^/api/leaderboard(/rank|/neighborhood)?$"),
+]
+
+
+class HttpCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.not_modified = 0
+        self.compressed = 0
+        self.bytes_original = 0
+        self.bytes_sent = 0
+        self.compress_seconds = 0.0
+        # ハンドラーの実行時間(304でもハンドラーは最後まで実行される)
+        self.handler_seconds = 0.0
+        self.not_modified_handler_seconds = 0.0
+
+    def record(self, original: int, sent: int, not_modified: bool = False, compressed: bool = False,
+               compress_seconds: float = 0.0, handler_seconds: float = 0.0):
+        with self._lock:
+            self.responses += 1
+            self.not_modified += not_modified
+            self.compressed += compressed
+            self.bytes_original += original
+            self.bytes_sent += sent
+            self.compress_seconds += compress_seconds
+            if not_modified:
+                self.not_modified_handler_seconds += handler_seconds
+            else:
+                self.handler_seconds += handler_seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            saved = self.bytes_original - self.bytes_sent
+            full = self.responses - self.not_modified
+            return {
+                "responses": self.responses,
+                "not_modified": self.not_modified,
+                "compressed": self.compressed,
+                "bytes_original": self.bytes_original,
+                "bytes_sent": self.bytes_sent,
+                "bytes_saved": saved,
+                "saved_ratio": round(saved / self.bytes_original, 4) if self.bytes_original else 0.0,
+                "compress_ms_avg": round(self.compress_seconds * 1000 / self.compressed, 3) if self.compressed else 0.0,
+                "handler_ms_avg": round(self.handler_seconds * 1000 / full, 3) if full else 0.0,
+                "not_modified_handler_ms_avg": (
+                    round(self.not_modified_handler_seconds * 1000 / self.not_modified, 3) if self.not_modified else 0.0
+                ),
+            }
+
+
+http_cache_stats = HttpCacheStats()
+
+
+def make_etag(body: bytes) -> str:
+    # 圧縮方式が違っても同じ内容なら同じ値になるよう弱いETagにする
+    return 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # 比較は弱い比較(W/ の有無を無視)
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _choose_encoding(accept_encoding: str):
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=6)
+
+
+class ConditionalResponseMiddleware:
+    """
+    対象のGETレスポンスにETagを付け、If-None-Matchが一致すれば304を返す。
+    304にならない場合は COMPRESSION_MIN_SIZE 以上のボディを br / gzip で圧縮する。
+    ETagは内容のハッシュなので、どの経路で値が変わっても(スキル更新・メンバー削除など)正しく検出できる。
+    304でもハンドラーは実行されるため、減るのは転送量と圧縮の時間だけ(benchmarks/http_cache.py)。
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not any(pattern.match(scope["path"]) for pattern in CACHEABLE_ROUTES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        start_message = {}
+        chunks = []
+
+        async def buffer(message):
+            if message["type"] == "http.response.start":
+                start_message.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        started = time.perf_counter()
+        await self.app(scope, receive, buffer)
+        handler_seconds = time.perf_counter() - started
+
+        body = b"".join(chunks)
+        status = start_message.get("status", 500)
+        headers = [
+            (name, value) for name, value in start_message.get("headers", [])
+            if name.lower() != b"content-length"
+        ]
+
+        if status != 200:
+            await self._send(send, status, headers, body)
+            return
+
+        header_names = {name.lower() for name, _ in headers}
+        etag = next((value.decode("latin-1") for name, value in headers if name.lower() == b"etag"), None)
+        if etag is None:
+            etag = make_etag(body)
+            headers.append((b"etag", etag.encode("latin-1")))
+        if b"cache-control" not in header_names:
+            # 毎回再検証させる(ユーザーごとに内容が違うので共有キャッシュには載せない)
+            headers.append((b"cache-control", b"private, no-cache"))
+        headers.append((b"vary", b"Authorization, Accept-Encoding"))
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            not_modified_headers = [
+                (name, value) for name, value in headers
+                if name.lower() in (b"etag", b"cache-control", b"vary")
+            ]
+            http_cache_stats.record(len(body), 0, not_modified=True, handler_seconds=handler_seconds)
+            await self._send(send, 304, not_modified_headers, b"")
+            return
+
+        encoding = _choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding and len(body) >= self.min_size and b"content-encoding" not in header_names:
+            started = time.perf_counter()
+            compressed = _compress(body, encoding)
+            elapsed = time.perf_counter() - started
+            headers.append((b"content-encoding", encoding.encode()))
+            http_cache_stats.record(
+                len(body), len(compressed), compressed=True, compress_seconds=elapsed, handler_seconds=handler_seconds
+            )
+            await self._send(send, status, headers, compressed)
+            return
+
+        http_cache_stats.record(len(body), len(body), handler_seconds=handler_seconds)
+        await self._send(send, status, headers, body)
+
+    @staticmethod
+    async def _send(send, status, headers, body):
+        if status != 304:
+            headers = headers + [(b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,222 @@
+import threading
+import time
+
+from sortedcontainers import SortedList
+from sqlalchemy.orm import Session
+
+from db.config import LEADERBOARD_MAX_AGE
+from utils.skills import SKILL_KEYS, load_skills
+
+METRICS = SKILL_KEYS + ("total",)
+
+
+def _with_total(skills: dict) -> dict:
+    scores = {key: skills.get(key, 0) for key in SKILL_KEYS}
+    scores["total"] = sum(scores.values())
+    return scores
+
+
+class SkillLeaderboard:
+    """
+    biz/design/tech/合計ごとのスキルランキングをプロセス内で保持する。
+
+    各指標は (-score, user_id) の SortedList で管理しているため、
+    更新・順位取得・上位K件の取得はいずれも O(log n) で行える。
+    """
+
+    def __init__(self, max_age: int = LEADERBOARD_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        # 再構築は1スレッドだけが行う(他のスレッドはその間、古いランキングを返す)
+        self._rebuild_lock = threading.Lock()
+        self._scores = {}
+        self._rankings = {metric: SortedList() for metric in METRICS}
+        self._loaded_at = None
+        self._rebuilding = False
+        self._touched_during_rebuild = set()
+
+    # --- 内部操作 ---
+
+    def _remove(self, user_id: str):
+        scores = self._scores.pop(user_id, None)
+        if scores is not None:
+            for metric in METRICS:
+                self._rankings[metric].remove((-scores[metric], user_id))
+
+    def _insert(self, user_id: str, scores: dict):
+        self._scores[user_id] = scores
+        for metric in METRICS:
+            self._rankings[metric].add((-scores[metric], user_id))
+
+    def _entry(self, metric: str, index: int) -> dict:
+        score, user_id = self._rankings[metric][index]
+        return {"rank": index + 1, "user_id": user_id, "score": -score}
+
+    # --- 更新 ---
+
+    def set_user(self, user_id: str, skills: dict):
+        """ユーザーのスキルを丸ごと置き換える(ステータス行の変更時など)"""
+        with self._lock:
+            self._remove(user_id)
+            self._insert(user_id, _with_total(skills))
+            if self._rebuilding:
+                self._touched_during_rebuild.add(user_id)
+
+    def add_growth(self, user_id: str, category: str, growth: int):
+        """テスト結果の追加分だけスコアを加算する"""
+        key = category.lower()
+        if key not in SKILL_KEYS:
+            return
+        with self._lock:
+            if self._rebuilding:
+                self._touched_during_rebuild.add(user_id)
+            if self._loaded_at is None:
+                return
+            scores = dict(self._scores.get(user_id) or _with_total({}))
+            scores[key] += growth
+            scores["total"] += growth
+            self._remove(user_id)
+            self._insert(user_id, scores)
+
+    def remove_user(self, user_id: str):
+        with self._lock:
+            self._remove(user_id)
+
+    def refresh_user(self, db: Session, user_id: str):
+        """DBから1ユーザー分を読み直して反映する"""
+        skills = load_skills(db, [user_id]).get(user_id)
+        with self._lock:
+            if skills is None:
+                self._remove(user_id)
+            else:
+                self.set_user(user_id, skills)
+
+    # --- 構築・整合性 ---
+
+    def rebuild(self, db: Session, blocking: bool = True) -> bool:
+        """
+        DBから全ユーザーのスキルを読み込んでランキングを作り直す。
+        blocking=False の場合、他のスレッドが再構築中なら何もせず False を返す。
+        """
+        if not self._rebuild_lock.acquire(blocking=blocking):
+            return False
+        try:
+            self._rebuild(db)
+        finally:
+            self._rebuild_lock.release()
+        return True
+
+    def _rebuild(self, db: Session):
+        with self._lock:
+            self._rebuilding = True
+            self._touched_during_rebuild = set()
+        try:
+            all_skills = load_skills(db)
+            rankings = {metric: SortedList() for metric in METRICS}
+            scores = {}
+            for user_id, skills in all_skills.items():
+                user_scores = _with_total(skills)
+                scores[user_id] = user_scores
+                for metric in METRICS:
+                    rankings[metric].add((-user_scores[metric], user_id))
+
+            with self._lock:
+                self._scores = scores
+                self._rankings = rankings
+                self._loaded_at = time.monotonic()
+                touched = self._touched_during_rebuild
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._touched_during_rebuild = set()
+
+        # 読み込み中に更新されたユーザーは、読み込み結果に含まれたか不明なので読み直す
+        for user_id in touched:
+            self.refresh_user(db, user_id)
+
+    def _is_fresh(self) -> bool:
+        with self._lock:
+            return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.max_age
+
+    def ensure_loaded(self, db: Session):
+        if self._is_fresh():
+            return
+        with self._lock:
+            loaded = self._loaded_at is not None
+        # 読み込み済みなら、他のスレッドが再構築している間は待たずに古いランキングを返す
+        if not self._rebuild_lock.acquire(blocking=not loaded):
+            return
+        try:
+            # 待っている間に他のスレッドが再構築を終えていれば読み直さない
+            if not self._is_fresh():
+                self._rebuild(db)
+        finally:
+            self._rebuild_lock.release()
+
+    def check_consistency(self, db: Session, repair: bool = False) -> dict:
+        """メモリ上のスコアとDBから計算したスコアを比較する"""
+        expected = {user_id: _with_total(skills) for user_id, skills in load_skills(db).items()}
+        with self._lock:
+            actual = dict(self._scores)
+            ranking_sizes = {metric: len(self._rankings[metric]) for metric in METRICS}
+
+        missing = set(expected) - set(actual)
+        extra = set(actual) - set(expected)
+        mismatched = [
+            user_id for user_id in set(expected) & set(actual) if expected[user_id] != actual[user_id]
+        ]
+        consistent = not (missing or extra or mismatched) and all(
+            size == len(actual) for size in ranking_sizes.values()
+        )
+
+        repaired = repair and not consistent and self.rebuild(db, blocking=False)
+
+        # ユーザーIDは返さず、件数だけを返す
+        return {
+            "consistent": consistent,
+            "users": len(expected),
+            "missing": len(missing),
+            "extra": len(extra),
+            "mismatched": len(mismatched),
+            "repaired": repaired,
+        }
+
+    # --- 参照 ---
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._scores)
+
+    def top(self, metric: str, limit: int = 10, offset: int = 0) -> list:
+        with self._lock:
+            ranking = self._rankings[metric]
+            end = min(offset + limit, len(ranking))
+            return [self._entry(metric, i) for i in range(offset, end)]
+
+    def rank(self, metric: str, user_id: str):
+        """1始まりの順位とスコアを返す。ランキングにいない場合は None"""
+        with self._lock:
+            scores = self._scores.get(user_id)
+            if scores is None:
+                return None
+            index = self._rankings[metric].index((-scores[metric], user_id))
+            return {"rank": index + 1, "user_id": user_id, "score": scores[metric]}
+
+    def neighborhood(self, metric: str, user_id: str, before: int = 5, after: int = 5, page: int = 0) -> list:
+        """
+        ユーザーの前後の順位を返す。
+        page を指定すると (before + after + 1) 件単位で上下にずらして取得できる。
+        """
+        with self._lock:
+            scores = self._scores.get(user_id)
+            if scores is None:
+                return None
+            ranking = self._rankings[metric]
+            index = ranking.index((-scores[metric], user_id))
+            window = before + after + 1
+            start = max(index - before + page * window, 0)
+            end = min(start + window, len(ranking))
+            return [self._entry(metric, i) for i in range(start, end)]
+
+
+leaderboard = SkillLeaderboard()
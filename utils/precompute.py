@@ -0,0 +1,441 @@
+"""
+スキルの派生データ(ユーザーごとの現在スキル・チームごとの合計とバランス)を
+バックグラウンドで再計算し、スナップショットテーブルに保存する。
+
+- 書き込み時に mark_user_dirty / mark_team_dirty で再計算対象に登録し、
+  PRECOMPUTE_DEBOUNCE_SECONDS 待ってまとめて再計算する
+- PRECOMPUTE_REFRESH_SECONDS ごとに全件を再計算する(他ワーカーでの書き込みの取りこぼし対策)。
+  job_leases テーブルの実行権を取れたワーカーだけが実行し、他のワーカーは再計算待ちだけを処理する
+- 書き込み側は同じトランザクションで expire_snapshots を呼び、スナップショットを全ワーカーで無効にする
+- 読み取り側は PRECOMPUTE_MAX_STALENESS 以内かつ無効化後に計算を始めたスナップショットだけを使い、
+  それ以外はその場で計算する
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from db.config import (
+    PRECOMPUTE_REFRESH_SECONDS,
+    PRECOMPUTE_MAX_STALENESS,
+    PRECOMPUTE_DEBOUNCE_SECONDS,
+    PRECOMPUTE_BATCH_SIZE,
+    PRECOMPUTE_MAX_RETRIES,
+)
+from db.database import SessionLocal
+from db.models import UserMaster, Team, TeamMember, UserSkillSnapshot, TeamSkillSnapshot, JobLease
+from utils.skills import SKILL_KEYS, load_base_status, load_growth, load_skills
+
+logger = logging.getLogger(__name__)
+
+FULL_REFRESH_LEASE = "precompute_full_refresh"
+
+# MySQLのロック待ちタイムアウト(1205)とデッドロック(1213)
+_LOCK_CONFLICT_CODES = {1205, 1213}
+RETRY_BACKOFF_SECONDS = 0.1
+
+
+def _is_lock_conflict(error: OperationalError) -> bool:
+    args = getattr(error.orig, "args", ())
+    return (bool(args) and args[0] in _LOCK_CONFLICT_CODES) or "database is locked" in str(error.orig)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def compute_user_skills(db: Session, user_ids) -> dict:
+    """user_id -> {"has_status", "biz", "design", "tech"}(ステータスがない場合のスキルは0)"""
+    user_ids = list(user_ids)
+    base = load_base_status(db, user_ids)
+    growth = load_growth(db, user_ids)
+    result = {}
+    for user_id in user_ids:
+        user_base = base.get(user_id, {})
+        user_growth = growth.get(user_id, {})
+        result[user_id] = {"has_status": user_id in base}
+        for key in SKILL_KEYS:
+            result[user_id][key] = user_base.get(key, 0) + user_growth.get(key, 0)
+    return result
+
+
+def compute_team_summaries(db: Session, team_ids) -> dict:
+    """team_id -> メンバー数・スキル合計・バランス"""
+    team_ids = list(team_ids)
+    members = {team_id: [] for team_id in team_ids}
+    for row in db.query(TeamMember.team_id, TeamMember.user_id).filter(TeamMember.team_id.in_(team_ids)).all():
+        members[row.team_id].append(row.user_id)
+    skills = load_skills(db, {user_id for user_ids in members.values() for user_id in user_ids})
+
+    summaries = {}
+    for team_id, user_ids in members.items():
+        totals = {key: sum(skills[user_id][key] for user_id in user_ids) for key in SKILL_KEYS}
+        highest = max(totals.values())
+        summaries[team_id] = {
+            "member_count": len(user_ids),
+            "biz_total": totals["biz"],
+            "design_total": totals["design"],
+            "tech_total": totals["tech"],
+            "balance": round(min(totals.values()) / highest, 4) if highest > 0 else 0.0,
+        }
+    return summaries
+
+
+# 無効化のために作る行の値(computed_at が古いので読み取りには使われない)
+_TOMBSTONE_COMPUTED_AT = datetime(1970, 1, 1)
+_TOMBSTONES = {
+    UserSkillSnapshot: {"has_status": False, "biz": 0, "design": 0, "tech": 0},
+    TeamSkillSnapshot: {"member_count": 0, "biz_total": 0, "design_total": 0, "tech_total": 0, "balance": 0.0},
+}
+
+
+def _expire(db: Session, model, key_column, ids):
+    ids = sorted(set(ids))
+    if not ids:
+        return
+    now = datetime.utcnow()
+    existing = {row[0] for row in db.query(key_column).filter(key_column.in_(ids)).all()}
+    if existing:
+        db.query(model).filter(key_column.in_(existing)).update({"invalidated_at": now}, synchronize_session=False)
+    for key in ids:
+        if key in existing:
+            continue
+        # 行がないと、書き込み前に計算を始めた他ワーカーの結果が有効な行として作られてしまう
+        try:
+            with db.begin_nested():
+                db.add(model(**{key_column.key: key}, **_TOMBSTONES[model],
+                             computed_at=_TOMBSTONE_COMPUTED_AT, invalidated_at=now))
+        except IntegrityError:
+            db.query(model).filter(key_column == key).update({"invalidated_at": now}, synchronize_session=False)
+
+
+def expire_snapshots(db: Session, user_ids=(), team_ids=()):
+    """
+    スキルやメンバーを変更する書き込みと同じトランザクションで呼ぶ(コミットは呼び出し側)。
+    コミット後はどのワーカーもこれらのスナップショットを使わず、再計算されるまでその場で計算する
+    """
+    _expire(db, UserSkillSnapshot, UserSkillSnapshot.user_id, user_ids)
+    _expire(db, TeamSkillSnapshot, TeamSkillSnapshot.team_id, team_ids)
+
+
+def _usable(model):
+    return or_(model.invalidated_at.is_(None), model.computed_at > model.invalidated_at)
+
+
+def _upsert(db: Session, model, key_column, rows: dict, computed_at: datetime):
+    existing = {getattr(obj, key_column.key): obj for obj in db.query(model).filter(key_column.in_(list(rows))).all()}
+    # 同時に更新するワーカー間でロックの取得順をそろえ、デッドロックを起こしにくくする
+    for key, values in sorted(rows.items()):
+        obj = existing.get(key)
+        if obj is None:
+            obj = model(**{key_column.key: key})
+            db.add(obj)
+        for name, value in values.items():
+            setattr(obj, name, value)
+        obj.computed_at = computed_at
+
+
+class PrecomputeScheduler:
+    def __init__(
+        self,
+        refresh_seconds: int = PRECOMPUTE_REFRESH_SECONDS,
+        max_staleness: int = PRECOMPUTE_MAX_STALENESS,
+        debounce_seconds: float = PRECOMPUTE_DEBOUNCE_SECONDS,
+        batch_size: int = PRECOMPUTE_BATCH_SIZE,
+        max_retries: int = PRECOMPUTE_MAX_RETRIES,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.max_staleness = max_staleness
+        self.debounce_seconds = debounce_seconds
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        # job_leases の実行権の持ち主としてワーカーを識別する
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        # id -> 登録順の番号。再計算中に再登録された場合は再計算後も残す
+        self._dirty_users = {}
+        self._dirty_teams = {}
+        self._sequence = 0
+        self._loop = None
+        self._wake = None
+        self._stats = {
+            "runs": {"incremental": 0, "full": 0},
+            "errors": 0,
+            "retries": 0,
+            "full_refresh_skipped": 0,
+            "users_computed": 0,
+            "teams_computed": 0,
+            "total_seconds": 0.0,
+            "last_run": None,
+            "last_full_refresh_at": None,
+        }
+
+    # --- 書き込み側 ---
+
+    def _mark(self, dirty: dict, ids):
+        with self._lock:
+            for entity_id in ids:
+                self._sequence += 1
+                dirty[entity_id] = self._sequence
+        # 同期ハンドラ(スレッドプール)からも呼ばれるため、イベントループ側でセットする
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:  # ループ終了後
+                pass
+
+    def mark_user_dirty(self, *user_ids):
+        self._mark(self._dirty_users, user_ids)
+
+    def mark_team_dirty(self, *team_ids):
+        self._mark(self._dirty_teams, team_ids)
+
+    def is_user_dirty(self, user_id) -> bool:
+        with self._lock:
+            return user_id in self._dirty_users
+
+    def is_team_dirty(self, team_id) -> bool:
+        with self._lock:
+            return team_id in self._dirty_teams
+
+    def _take_dirty(self):
+        with self._lock:
+            return dict(self._dirty_users), dict(self._dirty_teams)
+
+    def _clear_dirty(self, dirty: dict, done: dict):
+        with self._lock:
+            for entity_id, sequence in done.items():
+                if dirty.get(entity_id) == sequence:
+                    del dirty[entity_id]
+
+    # --- 再計算 ---
+
+    def _commit(self, db: Session, write):
+        """
+        write() の変更をコミットする。別ワーカーが同時に同じ行を作成した場合や、
+        デッドロック・ロック待ちタイムアウトの場合はロールバックしてやり直す
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                write()
+                db.commit()
+                return
+            except IntegrityError:
+                db.rollback()
+                if attempt == self.max_retries:
+                    raise
+            except OperationalError as e:
+                db.rollback()
+                if not _is_lock_conflict(e) or attempt == self.max_retries:
+                    raise
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            with self._lock:
+                self._stats["retries"] += 1
+
+    def _acquire_lease(self, db: Session, name: str, seconds: float) -> bool:
+        """
+        name の実行権を seconds 秒間取得する。自分が持っているか期限切れなら取得でき、
+        他のワーカーが持っていれば False を返す
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=seconds)
+        try:
+            updated = db.query(JobLease).filter(
+                JobLease.name == name,
+                or_(JobLease.owner == self.worker_id, JobLease.expires_at < now)
+            ).update({"owner": self.worker_id, "expires_at": expires_at}, synchronize_session=False)
+            if not updated:
+                # 行がなければ作成する。他のワーカーが持っている場合は主キー重複になる
+                db.add(JobLease(name=name, owner=self.worker_id, expires_at=expires_at))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        except OperationalError as e:
+            db.rollback()
+            if not _is_lock_conflict(e):
+                raise
+            return False
+
+    def recompute(self, db: Session, user_ids, team_ids) -> tuple:
+        """ユーザーとチームのスナップショットを再計算し、(ユーザー数, チーム数) を返す"""
+        team_ids = set(team_ids)
+        user_count = 0
+        for chunk in _chunks(user_ids, self.batch_size):
+            # 計算を始めた時刻を記録する。計算中に無効化された場合は、その行を使わせない
+            computed_at = datetime.utcnow()
+            skills = compute_user_skills(db, chunk)
+            self._commit(db, lambda: _upsert(db, UserSkillSnapshot, UserSkillSnapshot.user_id, skills, computed_at))
+            user_count += len(chunk)
+            # スキルが変わったユーザーの所属チームも再計算する
+            team_ids.update(
+                row.team_id for row in db.query(TeamMember.team_id).filter(TeamMember.user_id.in_(chunk)).all()
+            )
+
+        for chunk in _chunks(sorted(team_ids), self.batch_size):
+            computed_at = datetime.utcnow()
+            summaries = compute_team_summaries(db, chunk)
+            self._commit(db, lambda: _upsert(db, TeamSkillSnapshot, TeamSkillSnapshot.team_id, summaries, computed_at))
+        return user_count, len(team_ids)
+
+    def run_once(self, full: bool = False) -> dict:
+        """再計算待ち(full=True の場合は全件)を再計算する"""
+        started = time.perf_counter()
+        dirty_users, dirty_teams = self._take_dirty()
+        db = SessionLocal()
+        try:
+            # 全件の再計算は1つのワーカーだけが行う。取れなければ再計算待ちだけを処理する
+            if full and not self._acquire_lease(db, FULL_REFRESH_LEASE, self.refresh_seconds):
+                full = False
+                with self._lock:
+                    self._stats["full_refresh_skipped"] += 1
+            if full:
+                user_ids = [row.user_id for row in db.query(UserMaster.user_id).all()]
+                team_ids = [row.id for row in db.query(Team.id).all()]
+            else:
+                user_ids, team_ids = list(dirty_users), list(dirty_teams)
+            users, teams = self.recompute(db, user_ids, team_ids)
+            if full:
+                # 次回の実行時刻まで他のワーカーに実行させない
+                self._acquire_lease(db, FULL_REFRESH_LEASE, self.refresh_seconds)
+        finally:
+            db.close()
+        self._clear_dirty(self._dirty_users, dirty_users)
+        self._clear_dirty(self._dirty_teams, dirty_teams)
+
+        elapsed = time.perf_counter() - started
+        kind = "full" if full else "incremental"
+        run = {
+            "kind": kind,
+            "finished_at": datetime.utcnow().isoformat(),
+            "duration_ms": round(elapsed * 1000, 1),
+            "users": users,
+            "teams": teams,
+        }
+        with self._lock:
+            self._stats["runs"][kind] += 1
+            self._stats["users_computed"] += users
+            self._stats["teams_computed"] += teams
+            self._stats["total_seconds"] += elapsed
+            self._stats["last_run"] = run
+            if full:
+                self._stats["last_full_refresh_at"] = run["finished_at"]
+        return run
+
+    async def run(self, stop_event: asyncio.Event):
+        """FastAPIのlifespanで起動する。起動直後に全件を計算し、以降は書き込みと定期実行で再計算する"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        stopper = asyncio.create_task(stop_event.wait())
+        next_refresh = time.monotonic()
+        try:
+            while not stop_event.is_set():
+                timeout = max(0.0, next_refresh - time.monotonic())
+                waker = asyncio.create_task(self._wake.wait())
+                await asyncio.wait({waker, stopper}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                waker.cancel()
+                if stop_event.is_set():
+                    break
+
+                full = time.monotonic() >= next_refresh
+                if not full:
+                    # 続けて来る書き込みをまとめて再計算する
+                    await asyncio.wait({stopper}, timeout=self.debounce_seconds)
+                    if stop_event.is_set():
+                        break
+                self._wake.clear()
+                try:
+                    await asyncio.to_thread(self.run_once, full)
+                except Exception as e:
+                    logger.error(f"Precompute {'full' if full else 'incremental'} run failed: {e}")
+                    with self._lock:
+                        self._stats["errors"] += 1
+                if full:
+                    next_refresh = time.monotonic() + self.refresh_seconds
+        finally:
+            stopper.cancel()
+            self._loop = None
+
+    # --- 読み取り側 ---
+
+    def _fresh_after(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.max_staleness)
+
+    def fresh_user_snapshots(self, db: Session, user_ids) -> dict:
+        """鮮度の範囲内で、無効化されておらず再計算待ちでもないユーザーのスナップショット"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        snapshots = db.query(UserSkillSnapshot).filter(
+            UserSkillSnapshot.user_id.in_(user_ids),
+            UserSkillSnapshot.computed_at >= self._fresh_after(),
+            _usable(UserSkillSnapshot)
+        ).all()
+        return {s.user_id: s for s in snapshots if not self.is_user_dirty(s.user_id)}
+
+    def fresh_team_snapshot(self, db: Session, team_id: int):
+        snapshot = db.query(TeamSkillSnapshot).filter(
+            TeamSkillSnapshot.team_id == team_id,
+            TeamSkillSnapshot.computed_at >= self._fresh_after(),
+            _usable(TeamSkillSnapshot)
+        ).first()
+        if snapshot is None or self.is_team_dirty(team_id):
+            return None
+        return snapshot
+
+    def load_current_skills(self, db: Session, user_ids) -> dict:
+        """load_skills と同じ形式。使えるスナップショットがないユーザーだけその場で計算する"""
+        user_ids = list(user_ids)
+        snapshots = self.fresh_user_snapshots(db, user_ids)
+        skills = {user_id: {key: getattr(s, key) for key in SKILL_KEYS} for user_id, s in snapshots.items()}
+        missing = [user_id for user_id in user_ids if user_id not in skills]
+        if missing:
+            skills.update(load_skills(db, missing))
+        return skills
+
+    def stats(self, db: Session) -> dict:
+        now = datetime.utcnow()
+        with self._lock:
+            stats = {
+                **self._stats,
+                "runs": dict(self._stats["runs"]),
+                "pending": {"users": len(self._dirty_users), "teams": len(self._dirty_teams)},
+            }
+        total_runs = sum(stats["runs"].values())
+        stats["avg_run_ms"] = round(stats.pop("total_seconds") * 1000 / total_runs, 1) if total_runs else 0.0
+        stats["running"] = self._loop is not None
+        stats["max_staleness_seconds"] = self.max_staleness
+        stats["refresh_seconds"] = self.refresh_seconds
+        stats["worker_id"] = self.worker_id
+        lease = db.query(JobLease).filter(JobLease.name == FULL_REFRESH_LEASE).first()
+        stats["full_refresh_lease"] = {
+            "owner": lease.owner,
+            "expires_at": lease.expires_at.isoformat(),
+        } if lease else None
+
+        # スナップショットの鮮度(最も古い計算時刻からの経過秒数)
+        snapshots = {}
+        for name, model in (("users", UserSkillSnapshot), ("teams", TeamSkillSnapshot)):
+            count, oldest = db.query(func.count(), func.min(model.computed_at)).select_from(model).one()
+            stale = db.query(func.count()).select_from(model).filter(model.computed_at < self._fresh_after()).scalar()
+            snapshots[name] = {
+                "count": count,
+                "stale": stale,
+                "oldest_age_seconds": round((now - oldest).total_seconds(), 1) if oldest else None,
+            }
+        stats["snapshots"] = snapshots
+        return stats
+
+
+precompute = PrecomputeScheduler()
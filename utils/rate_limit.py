@@ -0,0 +1,266 @@
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from db.config import (
+    RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    LOGIN_RATE_LIMIT_PER_MINUTE,
+    LOGIN_RATE_LIMIT_BURST,
+    EXPENSIVE_ROUTE_CONCURRENCY,
+    TRUSTED_PROXIES,
+)
+from utils.security import verify_token
+
+LOGIN_PATH = "/api/auth/login"
+# ユーザーIDを読み取るログインリクエスト本文の上限(バイト)
+LOGIN_BODY_LIMIT = 4096
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def available(self, now: float) -> float:
+        """now 時点で補充済みのトークン数"""
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def take(self) -> float:
+        """トークンを1つ消費する。消費できなければ次に使えるまでの秒数を返す"""
+        now = time.monotonic()
+        self.tokens = self.available(now)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class KeyedRateLimiter:
+    """キー(ユーザーやIP)ごとのトークンバケット。古いキーはLRUで破棄する"""
+
+    def __init__(self, per_minute: int, burst: int, max_keys: int = 100000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def hit(self, key: str) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            retry_after = bucket.take()
+            if retry_after:
+                self.rejected += 1
+            else:
+                self.allowed += 1
+            return retry_after
+
+    def stats(self) -> dict:
+        # キー(他ユーザーのIDやIP)は返さず、件数だけを返す
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "per_minute": round(self.rate * 60),
+                "burst": self.burst,
+                "tracked_keys": len(self._buckets),
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "currently_limited": sum(1 for bucket in self._buckets.values() if bucket.available(now) < 1),
+            }
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.peak = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "active": self.active, "peak": self.peak, "rejected": self.rejected}
+
+
+user_limiter = KeyedRateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+login_limiter = KeyedRateLimiter(LOGIN_RATE_LIMIT_PER_MINUTE, LOGIN_RATE_LIMIT_BURST)
+
+# 同時実行数を制限する重いエンドポイント (名前, メソッド, パス)
+EXPENSIVE_ROUTES = [
+    ("get_team_info", "GET", re.compile(r"^/api/team/\d+$")),
+    ("get_teams_batch", "GET", re.compile(r"^/api/teams$")),
+    ("search_users", "POST", re.compile(r"^/api/user/search$")),
+    ("get_cohort_skill_trajectories", "GET", re.compile(r"^/api/analytics/skills$")),
+    # ランキングの再構築・整合性確認は全ユーザー分を読むため、2つで1つの枠を共有する
+    ("leaderboard_maintenance", "POST", re.compile(r"^/api/leaderboard/rebuild$")),
+    ("leaderboard_maintenance", "GET", re.compile(r"^/api/leaderboard/consistency$")),
+    # ストリーミング出力は送信が終わるまで枠を占有する
+    ("export", "GET", re.compile(r"^/api/export/")),
+]
+route_limiters = {name: ConcurrencyLimiter(EXPENSIVE_ROUTE_CONCURRENCY) for name, _, _ in EXPENSIVE_ROUTES}
+
+
+def limiter_stats() -> dict:
+    return {
+        "user": user_limiter.stats(),
+        "login": login_limiter.stats(),
+        "routes": {name: limiter.stats() for name, limiter in route_limiters.items()},
+    }
+
+
+def _client_ip(scope, trusted_proxies=()) -> str:
+    """
+    リクエスト元のIP。信頼するプロキシ経由の場合は X-Forwarded-For を右からたどり、
+    信頼するプロキシ以外の最初のアドレスを使う(クライアントが付けた左側の値は偽装できるため)
+    """
+    client = scope.get("client")
+    ip = client[0] if client else "unknown"
+    if ip not in trusted_proxies:
+        return ip
+    forwarded = [
+        value.decode("latin-1")
+        for name, value in scope.get("headers", [])
+        if name == b"x-forwarded-for"
+    ]
+    hops = [hop.strip() for value in forwarded for hop in value.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return ip
+
+
+async def _read_body(receive):
+    """本文を読み切り、アプリ側で同じ本文を受け取れる receive を返す"""
+    messages, body, more = [], b"", True
+    while more:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+
+    return body, replay
+
+
+def _login_user_id(body: bytes) -> str:
+    """ログイン本文の user_id。読み取れなければ空文字(不正な本文はIPだけで制限する)"""
+    if len(body) > LOGIN_BODY_LIMIT:
+        return ""
+    try:
+        user_id = json.loads(body).get("user_id")
+    except (ValueError, AttributeError):
+        return ""
+    return user_id if isinstance(user_id, str) else ""
+
+
+def _subject(scope):
+    """JWTの sub を取り出す。トークンがない・不正な場合は None"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return verify_token(token).get("sub")
+            except HTTPException:
+                return None
+    return None
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    """
+    リクエストの受付制御。
+    - ユーザー(JWTのsub、なければIP)ごとのレート制限 → 429
+    - ログインはIPと入力されたユーザーIDの組ごとのレート制限 → 429
+      (教室のNATなどで同じIPを共有していても、別のユーザーのログインは制限し合わない)
+    - 重いエンドポイントの同時実行数の上限 → 503
+    IPは trusted_proxies からの接続に限り X-Forwarded-For から取る。
+    """
+
+    def __init__(self, app, trusted_proxies=None):
+        self.app = app
+        self.trusted_proxies = frozenset(TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        ip = _client_ip(scope, self.trusted_proxies)
+        if path == LOGIN_PATH and scope["method"] == "POST":
+            body, receive = await _read_body(receive)
+            retry_after = login_limiter.hit(f"ip:{ip}:user:{_login_user_id(body)}")
+        else:
+            subject = _subject(scope)
+            key = f"user:{subject}" if subject else f"ip:{ip}"
+            retry_after = user_limiter.hit(key)
+        if retry_after:
+            await _reject(send, 429, "Too many requests", retry_after)
+            return
+
+        limiter = None
+        for name, method, pattern in EXPENSIVE_ROUTES:
+            if scope["method"] == method and pattern.match(path):
+                limiter = route_limiters[name]
+                break
+
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not limiter.try_acquire():
+            await _reject(send, 503, "Server busy", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,62 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+
+from db.models import StatusTable, TestResult
+
+# 1正解につき +2 の成長
+GROWTH_PER_CORRECT = 2
+
+SKILL_KEYS = ("biz", "design", "tech")
+
+
+def load_base_status(db: Session, user_ids=None) -> dict:
+    """StatusTableの初期値を user_id -> {"biz","design","tech"} で一括取得"""
+    query = db.query(StatusTable.user_id, StatusTable.biz, StatusTable.design, StatusTable.tech)
+    if user_ids is not None:
+        query = query.filter(StatusTable.user_id.in_(list(user_ids)))
+
+    base = {}
+    # 1ユーザーに複数行ある場合は .first() と同じく最初の行を採用
+    for row in query.order_by(StatusTable.id).all():
+        base.setdefault(row.user_id, {"biz": row.biz, "design": row.design, "tech": row.tech})
+    return base
+
+
+
+def load_growth(db: Session, user_ids=None) -> dict:
+    """test_resultsの成長分を user_id -> {"biz","design","tech"} で一括取得"""
+    query = db.query(
+        TestResult.user_id,
+        TestResult.category,
+        func.sum(TestResult.correct_answers).label("total_correct")
+    )
+    if user_ids is not None:
+        query = query.filter(TestResult.user_id.in_(list(user_ids)))
+
+    growth = {}
+    for row in query.group_by(TestResult.user_id, TestResult.category).all():
+        user_growth = growth.setdefault(row.user_id, {})
+        category = row.category.lower()
+        user_growth[category] = user_growth.get(category, 0) + (row.total_correct or 0) * GROWTH_PER_CORRECT
+    return growth
+
+
+def load_skills(db: Session, user_ids=None) -> dict:
+    """初期値(ステータスがない場合は0)に成長分を加算したスキルを一括取得"""
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+
+    base = load_base_status(db, user_ids)
+    growth = load_growth(db, user_ids)
+
+    targets = user_ids if user_ids is not None else set(base) | set(growth)
+    skills = {}
+    for user_id in targets:
+        user_base = base.get(user_id, {})
+        user_growth = growth.get(user_id, {})
+        skills[user_id] = {
+            key: user_base.get(key, 0) + user_growth.get(key, 0) for key in SKILL_KEYS
+        }
+    return skills
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from datetime import datetime
+
+from db.config import (
+    TEAM_EVENTS_MAX_SUBSCRIBERS,
+    TEAM_EVENTS_MAX_SUBSCRIBERS_PER_TEAM,
+    TEAM_EVENTS_QUEUE_SIZE,
+)
+
+# 全チームのイベントを購読するためのトピック
+ALL_TEAMS = "*"
+
+
+class SubscriptionLimitError(Exception):
+    """同時接続数の上限に達した"""
+
+
+class Subscription:
+    def __init__(self, topic, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def _deliver(self, event: dict):
+        # イベントループ上で実行される
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 読み出しが追いつかないクライアントは未送信分を破棄し、全件取り直しを促す
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "team_id": event.get("team_id")})
+
+    async def get(self, timeout: float = None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class TeamEventBroker:
+    """
+    チーム編成の変更イベントをプロセス内で配信するブローカー。
+
+    publish は同期ハンドラ(スレッドプール)からも呼べるよう、
+    各購読者のイベントループへ call_soon_threadsafe で受け渡す。
+    """
+
+    def __init__(
+        self,
+        max_subscribers: int = TEAM_EVENTS_MAX_SUBSCRIBERS,
+        max_per_team: int = TEAM_EVENTS_MAX_SUBSCRIBERS_PER_TEAM,
+        queue_size: int = TEAM_EVENTS_QUEUE_SIZE,
+    ):
+        self.max_subscribers = max_subscribers
+        self.max_per_team = max_per_team
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._total = 0
+        self._published = 0
+        self._rejected = 0
+
+    def subscribe(self, topic) -> Subscription:
+        """イベントループ上から呼ぶこと"""
+        subscription = Subscription(topic, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            # 上限を確認してから登録する(拒否した購読で空のトピックを残さない)
+            if self._total >= self.max_subscribers or len(self._subscribers.get(topic, ())) >= self.max_per_team:
+                self._rejected += 1
+                raise SubscriptionLimitError("Too many subscribers")
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            self._total += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers and subscription in subscribers:
+                subscribers.remove(subscription)
+                self._total -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def publish(self, event_type: str, team_id: int, **data):
+        event = {"type": event_type, "team_id": team_id, **data, "at": datetime.utcnow().isoformat()}
+        with self._lock:
+            targets = list(self._subscribers.get(team_id, ())) + list(self._subscribers.get(ALL_TEAMS, ()))
+            self._published += 1
+
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # イベントループが既に閉じている
+                self.unsubscribe(subscription)
+        return event
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": self._total,
+                "topics": {str(topic): len(subs) for topic, subs in self._subscribers.items()},
+                "published": self._published,
+                "rejected": self._rejected,
+                "max_subscribers": self.max_subscribers,
+                "max_per_team": self.max_per_team,
+            }
+
+
+team_events = TeamEventBroker()